@@ -17,10 +17,17 @@ Copyright 2023 Sebastian Kotstein
 
 from flask import Flask, request, jsonify, render_template, Response, url_for, send_from_directory
 from pipeline.pipeline import Pipeline, InvalidRequestException
+from pipeline.model_registry import ModelRegistry, UnknownModelException
 from pipeline.lru_cache import LRUCache
+from pipeline.sqlite_cache import SQLiteCache
+from pipeline.metrics import Gauge, timings_to_dict, format_server_timing
+from pipeline.result_format import format_result_v1, format_results_v1, format_item_v1, serialize
+from jobs import JobManager, JobLimitExceededException, STATUS_COMPLETED
 import json
 from datetime import datetime
-from werkzeug.exceptions import HTTPException, BadRequest, NotFound
+import threading
+import time
+from werkzeug.exceptions import HTTPException, BadRequest, NotFound, Conflict, ServiceUnavailable, NotImplemented as NotSupported
 from flask_swagger_ui import get_swaggerui_blueprint
 from representations import *
 from content_negotiation import *
@@ -33,12 +40,52 @@ MODEL_PM = "SebastianKotstein/restberta-qa-parameter-matching"
 MODEL_ED = "SebastianKotstein/restberta-qa-endpoint-discovery"
 MODEL_ED_PM = "SebastianKotstein/restberta-qa-pm-ed"
 
+# aliases of the RESTBERTa checkpoints that can be used in 'MODELS'
+MODEL_ALIASES = {
+    "pm": MODEL_PM,
+    "ed": MODEL_ED,
+    "pm-ed": MODEL_ED_PM
+}
+
 #model = os.getenv("MODEL",default=MODEL_PM)
 if "MODEL" in os.environ:
     model = os.environ["MODEL"]
 else:
     model = MODEL_PM
 
+# comma separated list of models hosted by this service, each entry is either 'alias=checkpoint' or one of the aliases 'pm', 'ed', and 'pm-ed',
+# e.g. "pm,ed,pm-ed" (default: only 'MODEL' with the alias 'default'). Models are loaded on first use.
+if "MODELS" in os.environ and os.environ["MODELS"].strip():
+    models = dict()
+    for entry in os.environ["MODELS"].split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "=" in entry:
+            alias, checkpoint = entry.split("=", 1)
+            models[alias.strip()] = checkpoint.strip()
+        elif entry in MODEL_ALIASES:
+            models[entry] = MODEL_ALIASES[entry]
+        else:
+            raise ValueError("Invalid entry '"+entry+"' in 'MODELS'. Entries must be 'alias=checkpoint' or one of the aliases "+", ".join(["'"+alias+"'" for alias in MODEL_ALIASES])+".")
+else:
+    models = {"default": model}
+
+# alias of the model that serves requests without an explicit model (default: the first model of 'MODELS'), it is loaded at startup
+if "DEFAULT_MODEL" in os.environ:
+    default_model = os.environ["DEFAULT_MODEL"]
+    if default_model not in models:
+        raise ValueError("Invalid value for 'DEFAULT_MODEL'. Allowed values are "+", ".join(["'"+alias+"'" for alias in models])+".")
+else:
+    default_model = next(iter(models))
+model = models[default_model]
+
+# maximum memory (in MB) occupied by the weights of the loaded models, the least recently used models are evicted if it is exceeded (default: unlimited)
+if "MODEL_MEMORY" in os.environ and os.environ["MODEL_MEMORY"]:
+    model_memory = int(os.environ["MODEL_MEMORY"])*1024*1024
+else:
+    model_memory = None
+
 #best_size = os.getenv("BEST_SIZE",default=20)
 if "BEST_SIZE" in os.environ:
     best_size = int(os.environ["BEST_SIZE"])
@@ -51,17 +98,177 @@ if "CACHE" in os.environ:
 else:
     cache_size = 100
 
+# 'memory' (cache of the worker process) or 'sqlite' (cache on disk that is shared by all workers of a node and survives restarts)
+if "CACHE_BACKEND" in os.environ:
+    cache_backend = os.environ["CACHE_BACKEND"]
+else:
+    cache_backend = "memory"
+if cache_backend != "memory" and cache_backend != "sqlite":
+    raise ValueError("Invalid value for 'CACHE_BACKEND'. Allowed values are 'memory' and 'sqlite'.")
+
+if "CACHE_PATH" in os.environ:
+    cache_path = os.environ["CACHE_PATH"]
+else:
+    cache_path = "/cache/results/results.sqlite"
+
 if "TOKEN" in os.environ:
     token = os.environ["TOKEN"]
 else:
     token = None
 
+# 'max_length' (pad every tokenized sample to 512 tokens) or 'dynamic' (pad tokenized samples only to the longest one of a request)
+if "PADDING" in os.environ:
+    padding = os.environ["PADDING"]
+else:
+    padding = "dynamic"
+
+# comma separated list of lengths, dynamically padded tokenized samples are rounded up to, e.g. "64,128,256,512"
+if "PADDING_BUCKETS" in os.environ:
+    padding_buckets = [int(bucket) for bucket in os.environ["PADDING_BUCKETS"].split(",") if bucket.strip()]
+else:
+    padding_buckets = [64,128,256,512]
+
+# maximum number of tokenized samples that are fed into the model at once (a request with more tokenized samples is processed in micro-batches)
+if "BATCH_SIZE" in os.environ:
+    batch_size = int(os.environ["BATCH_SIZE"])
+else:
+    batch_size = 32
+
+# maximum time (in milliseconds) a request waits for concurrent requests to share a model batch with (0 disables batching across requests)
+if "BATCH_WAIT" in os.environ:
+    max_batch_wait = float(os.environ["BATCH_WAIT"])/1000
+else:
+    max_batch_wait = 0
+
+# maximum number of schemas whose tokens are kept for reuse across queries and requests (0 disables the reuse)
+if "SCHEMA_CACHE" in os.environ:
+    schema_cache_size = int(os.environ["SCHEMA_CACHE"])
+else:
+    schema_cache_size = 100
+
+# if set, only the given number of properties that are lexically most similar to the query are fed into the model for schemas with more properties (default: disabled)
+if "PREFILTER_TOP_K" in os.environ and os.environ["PREFILTER_TOP_K"]:
+    prefilter_top_k = int(os.environ["PREFILTER_TOP_K"])
+else:
+    prefilter_top_k = None
+
+# minimum number of properties of a schema to be pre-filtered
+if "PREFILTER_MIN_PROPERTIES" in os.environ:
+    prefilter_min_properties = int(os.environ["PREFILTER_MIN_PROPERTIES"])
+else:
+    prefilter_min_properties = 0
+
+# 'tf' (TensorFlow) or 'onnx' (ONNX Runtime, the model is exported to ONNX once if the file 'ONNX_PATH' does not exist)
+if "BACKEND" in os.environ:
+    backend = os.environ["BACKEND"]
+else:
+    backend = "tf"
+
+if "ONNX_PATH" in os.environ:
+    onnx_path = os.environ["ONNX_PATH"]
+else:
+    onnx_path = "/cache/onnx/"+model.replace("/","--")+".onnx"
+
+# optional 'int8' for serving the model with int8 weights (requires BACKEND 'onnx', the quantized model is created from the ONNX model once)
+if "QUANTIZE" in os.environ and os.environ["QUANTIZE"]:
+    quantize = os.environ["QUANTIZE"]
+    print("Quantization '"+quantize+"' is experimental, check the agreement with the fp32 model (see check_backends.py)")
+else:
+    quantize = None
+
+# if set, the TensorFlow model is called through compiled inference functions (one per padding bucket), optionally compiled with XLA
+if "COMPILE" in os.environ:
+    compile_model = os.environ["COMPILE"].lower() in ["1","true","yes"]
+else:
+    compile_model = True
+
+if "XLA" in os.environ:
+    xla = os.environ["XLA"].lower() in ["1","true","yes"]
+else:
+    xla = False
+
+# if set, the model is warmed up with synthetic input at startup and '/ready' reports 503 until the warm-up has finished
+if "WARMUP" in os.environ:
+    warm_up = os.environ["WARMUP"].lower() in ["1","true","yes"]
+else:
+    warm_up = True
+
+# maximum number of jobs (see '/jobs') that are processed concurrently in the background
+if "JOB_WORKERS" in os.environ:
+    job_workers = int(os.environ["JOB_WORKERS"])
+else:
+    job_workers = 1
+
+# maximum number of jobs that are kept (finished jobs are discarded if this number is exceeded)
+if "JOBS" in os.environ:
+    max_jobs = int(os.environ["JOBS"])
+else:
+    max_jobs = 100
+
+# number of uwsgi worker processes (see start.sh), among which the CPU cores are split
+if "PROCESSES" in os.environ:
+    processes = int(os.environ["PROCESSES"])
+else:
+    processes = 1
+
+# number of threads a worker process uses within an operation of the model (default: CPU cores divided by the number of worker processes)
+if "INTRA_OP_THREADS" in os.environ:
+    intra_op_threads = int(os.environ["INTRA_OP_THREADS"])
+elif processes > 1:
+    intra_op_threads = max(1, (os.cpu_count() or 1)//processes)
+else:
+    intra_op_threads = None
+
+try:
+    import uwsgi
+    # if the app is loaded by the uwsgi master process (i.e., without 'lazy-apps'), the worker processes are forked afterwards and share the model copy-on-write
+    prefork = uwsgi.worker_id() == 0
+except ImportError:
+    prefork = False
+
 print("Model: ",model)
-if cache_size:
+if cache_size and cache_backend == "sqlite":
+    cache = SQLiteCache(cache_path,cache_size,False)
+elif cache_size:
     cache = LRUCache(cache_size,False)
 else:
     cache = None
-pipeline = Pipeline(model,best_size,cache,token)
+
+# 'ONNX_PATH' refers to the default model, the other models are exported to '/cache/onnx/' (if the backend is 'onnx')
+model_args = {alias: {"onnx_path": "/cache/onnx/"+checkpoint.replace("/","--")+".onnx"} for alias, checkpoint in models.items()}
+model_args[default_model] = {"onnx_path": onnx_path, "share_weights": prefork}
+registry = ModelRegistry(models, default_model, model_memory, cache, warm_up, "microsoft/codebert-base", padding, padding_buckets, schema_cache_size, {
+    "best_size": best_size,
+    "token": token,
+    "batch_size": batch_size,
+    "max_batch_wait": max_batch_wait,
+    "backend": backend,
+    "quantize": quantize,
+    "compile": compile_model,
+    "xla": xla,
+    "intra_op_threads": intra_op_threads,
+    "prefilter_top_k": prefilter_top_k,
+    "prefilter_min_properties": prefilter_min_properties
+}, model_args)
+# the default model is loaded at startup (before forking the worker processes, if the app is loaded by the uwsgi master process), the other models on first use.
+# The pipelines are always looked up in the registry (instead of keeping a reference here), so that an evicted model is released and reloaded on demand.
+registry.load(default_model)
+jobs = JobManager(registry,job_workers,max_jobs)
+registry.metrics.add(Gauge(registry.metrics.prefix+"_jobs_queue_depth", "Number of jobs that are queued or running", jobs.queue_depth))
+
+def start_worker():
+    # threads do not survive a fork, i.e., they are started in the worker process
+    registry.post_fork(intra_op_threads)
+    if warm_up:
+        threading.Thread(target=lambda: registry.load(default_model).warm_up(), name="warm-up", daemon=True).start()
+    else:
+        registry.load(default_model).ready.set()
+
+if prefork:
+    from uwsgidecorators import postfork
+    postfork(start_worker)
+else:
+    start_worker()
 
 
 SWAGGER_URL = '/docs' 
@@ -103,11 +310,7 @@ else:
 app.register_blueprint(swaggerui_blueprint)
 app.config['JSON_SORT_KEYS'] = False
 
-@app.route("/predict",methods=["POST"])
-@produces(MIME_TYPE_APPLICATION_JSON,MIME_TYPE_RESULTS_V1_JSON, default_mime_type=MIME_TYPE_RESULTS_V1_JSON)
-@consumes(MIME_TYPE_SCHEMAS_V1_JSON,MIME_TYPE_APPLICATION_JSON)
-def api():
-    args = request.args
+def parse_prediction_args(args):
     top_answers_n = None
     no_answer_strategy = None
 
@@ -124,9 +327,49 @@ def api():
         no_answer_strategy = "ignore"
     if no_answer_strategy != "treshold" and no_answer_strategy != "ignore":
         raise BadRequest(description = "Invalid value for query parameter 'no-answer-strategy'. Allowed values are 'ignore' and 'treshold'.")
+    return top_answers_n, suppress_duplicates, no_answer_strategy
+
+def get_pipeline(model = None):
+    """
+    Returns the pipeline of the model that is requested by the path (e.g. '/models/pm/predict') or the 'X-Model' header (default: the default model)
+    """
+    if model is None:
+        model = request.headers.get("X-Model") or None
+    try:
+        return registry.get(model)
+    except UnknownModelException as e:
+        raise NotFound(description = e.message)
+
+@app.route("/predict",methods=["POST"])
+@app.route("/models/<model>/predict",methods=["POST"])
+@produces(MIME_TYPE_APPLICATION_JSON,MIME_TYPE_RESULTS_V1_JSON,MIME_TYPE_RESULTS_V2_JSON,MIME_TYPE_APPLICATION_NDJSON,MIME_TYPE_RESULTS_V1_NDJSON,MIME_TYPE_RESULTS_V2_NDJSON, default_mime_type=MIME_TYPE_RESULTS_V1_JSON, pass_negotiated_mime_type=True)
+@consumes(MIME_TYPE_SCHEMAS_V1_JSON,MIME_TYPE_APPLICATION_JSON)
+def api(model = None, accept = None):
+    start = time.perf_counter()
+    top_answers_n, suppress_duplicates, no_answer_strategy = parse_prediction_args(request.args)
+    pipeline = get_pipeline(model)
+
+    # opt-in timing breakdown: 'header' (or 'true') adds a 'Server-Timing' header, 'body' additionally adds a '_timing' block to the response payload
+    timing = request.args.get("timing", request.headers.get("X-Timing", "")).lower()
+    if timing in ["1","true","yes"]:
+        timing = "header"
+    if timing and timing != "header" and timing != "body":
+        raise BadRequest(description = "Invalid value for query parameter 'timing'. Allowed values are 'header' and 'body'.")
 
     try:
-        response_payload = pipeline.process(request.json,top_answers_n,suppress_duplicates,no_answer_strategy)
+        if accept in [MIME_TYPE_APPLICATION_NDJSON, MIME_TYPE_RESULTS_V1_NDJSON, MIME_TYPE_RESULTS_V2_NDJSON]:
+            # stream one result per (schema, query) pair as soon as it is available (cached results first)
+            results = pipeline.process_stream(request.json,top_answers_n,suppress_duplicates,no_answer_strategy)
+            response = Response(serialize_stream(results, accept != MIME_TYPE_RESULTS_V2_NDJSON), mimetype=accept)
+            # disable response buffering of reverse proxies (e.g. nginx)
+            response.headers["X-Accel-Buffering"] = "no"
+            return response
+
+        timings = dict()
+        response_payload = pipeline.process(request.json,top_answers_n,suppress_duplicates,no_answer_strategy,timings)
+        if timing == "body":
+            # the block cannot contain the duration of the serialization, which is reported in the 'Server-Timing' header only
+            response_payload["_timing"] = timings_to_dict(timings)
         response_payload["_links"] = [
             {
                 "rel":"prediction",
@@ -138,12 +381,110 @@ def api():
             }
         ]
 
-        response = jsonify(response_payload)
+        with registry.metrics.stage("serialize", timings):
+            response = create_results_response(response_payload, accept)
+        if timing:
+            response.headers["Server-Timing"] = format_server_timing(timings, time.perf_counter()-start)
         #response.mimetype=MIME_TYPE_RESULTS_V1_JSON
         return response
     except InvalidRequestException as e:
         raise BadRequest(description = e.message)
 
+def serialize_stream(results, v1 = True):
+    for result in results:
+        with registry.metrics.stage("serialize"):
+            if v1:
+                result = format_item_v1(result)
+            line = serialize(result)+b"\n"
+        yield line
+
+def create_results_response(payload, accept):
+    """
+    Serializes the passed results in the negotiated representation: v2 keeps scores and probabilities as numbers, v1 (and plain JSON) formats them as strings
+    """
+    if accept == MIME_TYPE_RESULTS_V2_JSON:
+        return Response(serialize(payload), mimetype=MIME_TYPE_RESULTS_V2_JSON)
+    # generic JSON responses are labeled with the v1 media type by 'produces'
+    return Response(serialize(format_results_v1(payload)), mimetype=MIME_TYPE_APPLICATION_JSON)
+
+
+@app.route("/jobs",methods=["POST"])
+@app.route("/models/<model>/jobs",methods=["POST"])
+@produces(MIME_TYPE_JOB_V1_JSON,MIME_TYPE_APPLICATION_JSON)
+@consumes(MIME_TYPE_SCHEMAS_V1_JSON,MIME_TYPE_APPLICATION_JSON)
+def create_job(model = None):
+    # jobs are kept in the memory of the worker process that has accepted them, i.e., a job could not be queried through the other workers
+    if processes > 1:
+        raise NotSupported(description = "Jobs are not supported if the service runs multiple worker processes (PROCESSES > 1). Use '/predict' instead, e.g., with 'Accept: application/x-ndjson' for large requests.")
+    top_answers_n, suppress_duplicates, no_answer_strategy = parse_prediction_args(request.args)
+    pipeline = get_pipeline(model)
+    try:
+        job = jobs.submit(request.json,top_answers_n,suppress_duplicates,no_answer_strategy,pipeline)
+    except InvalidRequestException as e:
+        raise BadRequest(description = e.message)
+    except JobLimitExceededException as e:
+        raise ServiceUnavailable(description = e.message)
+    response = job_to_response(job)
+    response.status_code = 202
+    response.headers["Location"] = url_for("get_job",id=job.id)
+    return response
+
+@app.route("/jobs/<id>",methods=["GET"])
+@produces(MIME_TYPE_JOB_V1_JSON,MIME_TYPE_APPLICATION_JSON)
+def get_job(id):
+    job = jobs.get(id)
+    if not job:
+        raise NotFound("The requested job with ID '"+id+"' does not exist.")
+    return job_to_response(job)
+
+@app.route("/jobs/<id>",methods=["DELETE"])
+def delete_job(id):
+    # cancels the job if it has not finished yet and discards its results
+    if not jobs.delete(id):
+        raise NotFound("The requested job with ID '"+id+"' does not exist.")
+    return Response(status=204)
+
+@app.route("/jobs/<id>/results",methods=["GET"])
+@produces(MIME_TYPE_APPLICATION_JSON,MIME_TYPE_RESULTS_V1_JSON,MIME_TYPE_RESULTS_V2_JSON, default_mime_type=MIME_TYPE_RESULTS_V1_JSON, pass_negotiated_mime_type=True)
+def get_job_results(id, accept = None):
+    job = jobs.get(id)
+    if not job:
+        raise NotFound("The requested job with ID '"+id+"' does not exist.")
+    if job.status != STATUS_COMPLETED:
+        raise Conflict("The results of the job with ID '"+id+"' are not available, since its status is '"+job.status+"'.")
+    payload = dict(job.input_dict)
+    payload["_links"] = [
+        {
+            "rel":"job",
+            "href": url_for("get_job",id=id)
+        },
+        {
+            "rel":"base",
+            "href": url_for("base")
+        }
+    ]
+    return create_results_response(payload, accept)
+
+def job_to_response(job):
+    payload = job.to_dict()
+    payload["_links"] = [
+        {
+            "rel":"self",
+            "href": url_for("get_job",id=job.id)
+        }
+    ]
+    if job.status == STATUS_COMPLETED:
+        payload["_links"].append({
+            "rel":"results",
+            "href": url_for("get_job_results",id=job.id)
+        })
+    payload["_links"].append({
+        "rel":"base",
+        "href": url_for("base")
+    })
+    response = jsonify(payload)
+    response.mimetype = MIME_TYPE_JOB_V1_JSON
+    return response
 
 @app.route("/",methods=["GET"])
 @produces(MIME_TYPE_APPLICATION_XHTML_XML,MIME_TYPE_TEXT_HTML,MIME_TYPE_HYPERMEDIA_V1_JSON,MIME_TYPE_APPLICATION_JSON)
@@ -157,6 +498,14 @@ def base():
                     "rel":"prediction",
                     "href": url_for("api")
                 },
+                {
+                    "rel":"jobs",
+                    "href":url_for("create_job")
+                },
+                {
+                    "rel":"models",
+                    "href":url_for("get_models")
+                },
                 {
                     "rel":"cache",
                     "href":url_for("get_cache_settings")
@@ -174,6 +523,39 @@ def base():
         response.mimetype = MIME_TYPE_HYPERMEDIA_V1_JSON
         return response
     
+@app.route("/models",methods=["GET"])
+@produces(MIME_TYPE_MODELS_V1_JSON,MIME_TYPE_APPLICATION_JSON)
+def get_models():
+    models = registry.describe()
+    for model in models:
+        model["_links"] = [
+            {
+                "rel":"prediction",
+                "href": url_for("api",model=model["alias"])
+            },
+            {
+                "rel":"jobs",
+                "href": url_for("create_job",model=model["alias"])
+            }
+        ]
+    response = jsonify({
+        "models": models,
+        "memoryBudget": registry.memory_budget,
+        "memoryUsage": registry.memory_usage(),
+        "_links":[
+            {
+                "rel":"self",
+                "href": url_for("get_models")
+            },
+            {
+                "rel":"base",
+                "href": url_for("base")
+            }
+        ]
+    })
+    response.mimetype = MIME_TYPE_MODELS_V1_JSON
+    return response
+
 @app.route("/cache",methods=["GET"])
 @produces(MIME_TYPE_CACHE_SETTINGS_V1_JSON,MIME_TYPE_APPLICATION_JSON)
 def get_cache_settings():
@@ -181,6 +563,7 @@ def get_cache_settings():
     if cache:
         payload["isEnabled"] = True
         payload["cacheSize"] = cache_size
+        payload["statistics"] = cache.statistics()
     else:
         payload["isEnabled"] = False
 
@@ -210,20 +593,14 @@ def get_cached_items():
     if cache:
         payload = dict()
         payload["cachedItems"] = []
-        for key in cache.results.keys():
-            id = cache.keys_to_ids[key]
-            payload["cachedItems"].append({
-                "id":id,
-                "key":key,
-                "priority":cache.access_counters[key],
-                "isVerbose":cache.verbose_info[key],
-                "_links":[
-                    {
-                        "rel":"item",
-                        "href":url_for("get_cached_item",id=id)
-                    }
-                ]
-            })
+        for item in cache.items():
+            item["_links"] = [
+                {
+                    "rel":"item",
+                    "href":url_for("get_cached_item",id=item["id"])
+                }
+            ]
+            payload["cachedItems"].append(item)
         response = jsonify(payload)
         response.mimetype = MIME_TYPE_CACHED_ITEMS_V1_JSON
         return response
@@ -234,14 +611,10 @@ def get_cached_items():
 @produces(MIME_TYPE_CACHED_ITEMS_V1_JSON, MIME_TYPE_APPLICATION_JSON)
 def get_cached_item(id):
     if cache:
-        if id in cache.ids_to_keys.keys():
-            payload = dict()
-            payload["id"] = id
-            key = cache.ids_to_keys[id]
-            payload["key"] = key
-            payload["priority"] = cache.access_counters[key]
-            payload["isVerbose"] = cache.verbose_info[key]
-            payload["data"] = cache.results[key]
+        payload = cache.get_item(id)
+        if payload:
+            # the cached result is shown in the v1 representation (scores and probabilities as strings)
+            payload["data"] = format_result_v1(payload["data"])
             payload["_links"] = [
                     {
                         "rel":"collection",
@@ -261,6 +634,23 @@ def get_cached_item(id):
        raise NotFound("The requested resource does not exist, since caching is disabled.") 
     
 
+@app.route("/ready",methods=["GET"])
+def get_readiness():
+    # readiness probe for load balancers (without content negotiation, since probes typically accept '*/*')
+    # the probe never loads a model (an evicted default model is reloaded by the next request that uses it)
+    if registry.is_ready(default_model):
+        response = jsonify({"status":"ready"})
+    else:
+        response = jsonify({"status":"warming up"})
+        response.status_code = 503
+    response.mimetype = MIME_TYPE_READINESS_V1_JSON
+    return response
+
+@app.route("/metrics",methods=["GET"])
+def get_metrics():
+    # metrics of this worker process in the Prometheus text format (without content negotiation, since scrapers send various 'Accept' headers)
+    return Response(registry.metrics.render(), mimetype=MIME_TYPE_PROMETHEUS_TEXT)
+
 @app.route('/openapi.yml')
 def send_docs():
     return send_from_directory(app.static_folder, 'OpenAPI.yml')
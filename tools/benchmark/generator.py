@@ -0,0 +1,115 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+import random
+
+# building blocks of synthetic Web API elements in the style of the examples of the Web UI, e.g.,
+# 'location.postal_code' (property list) or 'users.{userId}.address.get' (endpoint list)
+RESOURCES = ["users", "orders", "products", "accounts", "payments", "invoices", "customers", "items", "carts", "reviews",
+             "shipments", "addresses", "teams", "projects", "tasks", "comments", "files", "messages", "events", "tickets"]
+PROPERTIES = ["id", "name", "key", "city", "city_id", "country", "lat", "lon", "postal_code", "state", "units", "email", "phone",
+              "created_at", "updated_at", "status", "price", "currency", "amount", "quantity", "description", "title", "type",
+              "street", "first_name", "last_name", "language", "timezone", "token", "limit", "offset", "page", "size", "sort"]
+OBJECTS = ["auth", "location", "address", "user", "order", "product", "payment", "customer", "settings", "metadata", "owner", "billing"]
+METHODS = ["get", "post", "put", "patch", "delete"]
+QUERIES = ["The ZIP of the city", "The API key", "Latitude of the location", "The country", "The unit system", "Email address of the customer",
+           "Total price of the order", "Create a new user", "Delete a user", "Get the address of a user", "Update a user", "Login",
+           "List all orders of a customer", "Number of items per page", "Sort order of the results", "Cancel a payment"]
+
+def generate_properties(n: int, rng: random.Random):
+    """
+    Generates a list of 'n' distinct properties, e.g., 'state' or 'location.postal_code'
+    """
+    properties = set()
+    while len(properties) < n:
+        depth = rng.choice([1, 2, 2, 3])
+        path = [rng.choice(OBJECTS) for _ in range(depth-1)] + [rng.choice(PROPERTIES)]
+        # make the property unique if the vocabulary is exhausted
+        if ".".join(path) in properties:
+            path[-1] = path[-1]+"_"+str(len(properties))
+        properties.add(".".join(path))
+    return sorted(properties)
+
+def generate_endpoints(n: int, rng: random.Random):
+    """
+    Generates a list of 'n' distinct endpoints, e.g., 'users.get' or 'users.{userId}.address.put'
+    """
+    endpoints = set()
+    while len(endpoints) < n:
+        resource = rng.choice(RESOURCES)
+        path = [resource]
+        if rng.random() < 0.6:
+            path.append("{"+resource[:-1]+"Id}")
+            if rng.random() < 0.5:
+                path.append(rng.choice(RESOURCES + OBJECTS))
+        path.append(rng.choice(METHODS))
+        if ".".join(path) in endpoints:
+            path.insert(-1, "v"+str(len(endpoints)))
+        endpoints.add(".".join(path))
+    return sorted(endpoints)
+
+def generate_payload(n_schemas = 1, n_elements = 10, n_queries = 5, kind = "properties", verbose = False, seed = 0):
+    """
+    Generates a '/predict' payload with 'n_schemas' schemas, each consisting of 'n_elements' Web API elements and 'n_queries' queries.
+
+    Parameters
+    ----------
+    n_schemas : int
+        Number of schemas
+    n_elements : int
+        Number of Web API elements (properties or endpoints) per schema
+    n_queries : int
+        Number of queries per schema
+    kind : str
+        'properties' (property lists) or 'endpoints' (endpoint lists)
+    verbose : bool
+        Verbose output flag of the queries
+    seed : int
+        Seed of the random generator (the same arguments always result in the same payload)
+
+    Returns
+    -------
+    The payload as dictionary
+    """
+    if kind != "properties" and kind != "endpoints":
+        raise ValueError("Invalid kind '"+str(kind)+"'. Allowed values are 'properties' and 'endpoints'.")
+    rng = random.Random(seed)
+    schemas = []
+    for i in range(n_schemas):
+        elements = generate_properties(n_elements, rng) if kind == "properties" else generate_endpoints(n_elements, rng)
+        schemas.append({
+            "schemaId": "s"+str(i),
+            "value": " ".join(elements),
+            "queries": [
+                {"queryId": "q"+str(j), "value": rng.choice(QUERIES), "verboseOutput": verbose} for j in range(n_queries)
+            ]
+        })
+    return {"schemas": schemas}
+
+def generate_corpus(n = 1000, seed = 0):
+    """
+    Generates 'n' lines of text covering the vocabulary of the generated payloads (used for training an offline tokenizer)
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        if i % 3 == 0:
+            lines.append(" ".join(generate_endpoints(20, rng)))
+        elif i % 3 == 1:
+            lines.append(" ".join(generate_properties(20, rng)))
+        else:
+            lines.append(rng.choice(QUERIES))
+    return lines
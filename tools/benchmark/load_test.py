@@ -0,0 +1,215 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from benchmark.generator import generate_payload
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# the load is only generated against a local instance
+LOCAL_HOSTS = ["localhost", "127.0.0.1", "::1"]
+
+# requests are never routed through a proxy (e.g. configured by 'HTTP_PROXY')
+opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+def check_local_url(url):
+    host = urllib.parse.urlparse(url).hostname
+    if host not in LOCAL_HOSTS:
+        raise ValueError("The load test only runs against localhost, but the URL refers to '"+str(host)+"'.")
+
+def load_payloads(path):
+    payloads = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                payloads.append(line.strip().encode("utf-8"))
+    return payloads
+
+def send(url, payload, timeout):
+    """
+    Sends the passed payload (bytes) to the passed URL and returns the start time, latency (in seconds), status code (None if no response has been received), and error (if any)
+    """
+    request = urllib.request.Request(url, data=payload, method="POST", headers={
+        "Content-Type": "application/vnd.skotstein.restberta-core.schemas.v1+json",
+        "Accept": "application/vnd.skotstein.restberta-core.results.v1+json"
+    })
+    start = time.perf_counter()
+    try:
+        with opener.open(request, timeout=timeout) as response:
+            response.read()
+            return start, time.perf_counter()-start, response.status, None
+    except urllib.error.HTTPError as e:
+        return start, time.perf_counter()-start, e.code, "HTTP "+str(e.code)
+    except Exception as e:
+        return start, time.perf_counter()-start, None, type(e).__name__+": "+str(e)
+
+def run_fixed_concurrency(url, payloads, concurrency, duration, timeout):
+    """
+    Closed loop: 'concurrency' clients send the payloads (round robin) one after another until 'duration' seconds have passed
+    """
+    records = []
+    lock = threading.Lock()
+    payload_cycle = itertools.cycle(payloads)
+    end = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < end:
+            with lock:
+                payload = next(payload_cycle)
+            record = send(url, payload, timeout)
+            with lock:
+                records.append(record)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records
+
+def run_fixed_rate(url, payloads, rate, duration, timeout, max_in_flight = 256):
+    """
+    Open loop: the payloads (round robin) are sent at a fixed arrival rate of 'rate' requests per second for 'duration' seconds, independently of the latency of the responses
+    """
+    futures = []
+    payload_cycle = itertools.cycle(payloads)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for i in range(int(rate*duration)):
+            # wait until the scheduled arrival time of the next request
+            delay = start + i/rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(send, url, next(payload_cycle), timeout))
+    return [future.result() for future in futures]
+
+def summarize(records, duration, interval = 1.0):
+    """
+    Returns the latency percentiles (in milliseconds), error rate, and throughput of the passed records as well as a timeline with these values per interval (in seconds)
+    """
+    def statistics(records, duration):
+        latencies = np.asarray([latency for _, latency, status, error in records if error is None]) * 1000
+        errors = len([record for record in records if record[3] is not None])
+        summary = {
+            "requests": len(records),
+            "errors": errors,
+            "errorRate": errors/len(records) if records else 0,
+            "throughput": (len(records)-errors)/duration if duration else 0
+        }
+        if len(latencies):
+            summary.update({
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "p99": float(np.percentile(latencies, 99)),
+                "mean": float(latencies.mean()),
+                "max": float(latencies.max())
+            })
+        return summary
+
+    if not records:
+        return {"summary": statistics(records, duration), "timeline": [], "errors": {}}
+    first = min([record[0] for record in records])
+    n_intervals = max(1, int(np.ceil(duration/interval)))
+    interval_records = [[] for _ in range(n_intervals)]
+    for record in records:
+        # requests are assigned to the interval in which their response has been received
+        i = min(int((record[0]+record[1]-first)/interval), n_intervals-1)
+        interval_records[i].append(record)
+    timeline = [dict(second=i*interval, **statistics(interval_records[i], interval)) for i in range(n_intervals)]
+    error_messages = dict()
+    for record in records:
+        if record[3] is not None:
+            error_messages[record[3]] = error_messages.get(record[3], 0) + 1
+    return {"summary": statistics(records, duration), "timeline": timeline, "errors": error_messages}
+
+def compare(reports):
+    """
+    Prints a table comparing the summaries of the passed reports (e.g. of runs with different worker counts, cache sizes, or backends)
+    """
+    columns = ["requests", "errorRate", "throughput", "p50", "p95", "p99", "max"]
+    print("label".ljust(30)+"".join([column.rjust(12) for column in columns]))
+    for report in reports:
+        summary = report["summary"]
+        values = [summary.get(column) for column in columns]
+        print(str(report["label"]).ljust(30)+"".join([(str(round(value, 3)) if value is not None else "-").rjust(12) for value in values]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays '/predict' payloads against a local instance (nginx, uwsgi, Flask) at a fixed concurrency or a fixed arrival rate and reports latency percentiles (ms), error rates, and throughput (over time) as JSON")
+    parser.add_argument("--url", default="http://localhost:80/predict", help="URL of the '/predict' endpoint of the local instance")
+    parser.add_argument("--payloads", default=None, help="JSONL file with one '/predict' payload per line (default: generated payloads)")
+    parser.add_argument("--kind", default="properties", help="Kind of generated payloads: 'properties' or 'endpoints'")
+    parser.add_argument("--schemas", type=int, default=1, help="Number of schemas per generated payload")
+    parser.add_argument("--elements", type=int, default=50, help="Number of Web API elements per schema of the generated payloads")
+    parser.add_argument("--queries", type=int, default=5, help="Number of queries per schema of the generated payloads")
+    parser.add_argument("--distinct", type=int, default=100, help="Number of distinct generated payloads (fewer payloads result in more cache hits)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Number of concurrent clients (closed loop)")
+    parser.add_argument("--rate", type=float, default=None, help="Arrival rate in requests per second (open loop)")
+    parser.add_argument("--duration", type=float, default=60, help="Duration of the run in seconds")
+    parser.add_argument("--timeout", type=float, default=300, help="Timeout of a request in seconds")
+    parser.add_argument("--label", default=None, help="Label of the run, e.g. 'onnx-4-workers-cache-0' (default: load settings)")
+    parser.add_argument("--output", default=None, help="Output JSON file (default: stdout)")
+    parser.add_argument("--compare", nargs="+", default=None, help="Instead of running a load test, print a comparison of the passed report files")
+    args = parser.parse_args()
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as file:
+                reports.append(json.load(file))
+        compare(reports)
+        sys.exit(0)
+
+    if (args.concurrency is None) == (args.rate is None):
+        parser.error("Either '--concurrency' or '--rate' must be set.")
+    check_local_url(args.url)
+
+    if args.payloads:
+        payloads = load_payloads(args.payloads)
+    else:
+        payloads = [json.dumps(generate_payload(args.schemas, args.elements, args.queries, args.kind, seed=seed)).encode("utf-8") for seed in range(args.distinct)]
+
+    start = time.perf_counter()
+    if args.concurrency:
+        records = run_fixed_concurrency(args.url, payloads, args.concurrency, args.duration, args.timeout)
+        load = "concurrency="+str(args.concurrency)
+    else:
+        records = run_fixed_rate(args.url, payloads, args.rate, args.duration, args.timeout)
+        load = "rate="+str(args.rate)
+    duration = time.perf_counter() - start
+
+    report = {
+        "label": args.label or load,
+        "settings": {key: value for key, value in vars(args).items() if key not in ["output", "compare"]},
+        "duration": duration
+    }
+    report.update(summarize(records, duration))
+    print(report["label"], json.dumps(report["summary"]), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
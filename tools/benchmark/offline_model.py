@@ -0,0 +1,86 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from benchmark.generator import generate_corpus
+
+import os
+
+# model sizes: 'base' has the architecture of the RESTBERTa checkpoints (RoBERTa base), 'small' is meant for quick runs
+MODEL_SIZES = {
+    "base": {"hidden_size": 768, "num_hidden_layers": 12, "num_attention_heads": 12, "intermediate_size": 3072},
+    "small": {"hidden_size": 128, "num_hidden_layers": 2, "num_attention_heads": 2, "intermediate_size": 512}
+}
+
+def create_offline_tokenizer(directory, vocab_size = 8000):
+    """
+    Trains a byte-level BPE tokenizer (like the one of RoBERTa/CodeBERT) on a generated corpus and stores it as RoBERTa tokenizer in the passed directory.
+    """
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import RobertaTokenizerFast
+
+    os.makedirs(directory, exist_ok=True)
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(generate_corpus(), vocab_size=vocab_size, special_tokens=["<s>", "<pad>", "</s>", "<unk>", "<mask>"])
+    bpe.save_model(directory)
+    tokenizer = RobertaTokenizerFast(vocab_file=os.path.join(directory, "vocab.json"), merges_file=os.path.join(directory, "merges.txt"), model_max_length=512)
+    tokenizer.save_pretrained(directory)
+    return tokenizer
+
+def create_offline_checkpoint(directory, size = "base", vocab_size = 8000, seed = 0):
+    """
+    Creates a randomly initialized RoBERTa question answering model (TensorFlow) and a matching tokenizer and stores both in the passed directory,
+    so that the pipeline can be benchmarked without downloading a checkpoint. The predictions of the model are meaningless, but its computational cost
+    corresponds to the one of a trained model of the same size.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the checkpoint (model and tokenizer)
+    size : str
+        'base' (architecture of the RESTBERTa checkpoints) or 'small'
+    vocab_size : int
+        Size of the vocabulary of the tokenizer
+    seed : int
+        Seed for initializing the weights
+
+    Returns
+    -------
+    The directory of the checkpoint
+    """
+    import tensorflow as tf
+    from transformers import RobertaConfig, TFRobertaForQuestionAnswering
+
+    if size not in MODEL_SIZES:
+        raise ValueError("Invalid size '"+str(size)+"'. Allowed values are "+", ".join(["'"+size+"'" for size in MODEL_SIZES])+".")
+    if os.path.exists(os.path.join(directory, "config.json")):
+        return directory
+
+    tokenizer = create_offline_tokenizer(directory, vocab_size)
+    config = RobertaConfig(
+        vocab_size=len(tokenizer),
+        max_position_embeddings=514,
+        type_vocab_size=1,
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        **MODEL_SIZES[size]
+    )
+    tf.random.set_seed(seed)
+    model = TFRobertaForQuestionAnswering(config)
+    # build the model (i.e., create its weights) before storing it
+    model(model.dummy_inputs)
+    model.save_pretrained(directory)
+    return directory
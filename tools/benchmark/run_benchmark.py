@@ -0,0 +1,130 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from pipeline.pipeline import Pipeline
+from benchmark.generator import generate_payload
+from benchmark.offline_model import create_offline_checkpoint
+
+import argparse
+import copy
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+def summarize(durations, windows = None):
+    """
+    Returns the percentiles (in milliseconds) of the passed durations (in seconds) and, if the number of windows per run is passed, the throughput in windows per second.
+    """
+    durations = np.asarray(durations)
+    summary = {
+        "runs": len(durations),
+        "p50": float(np.percentile(durations, 50)*1000),
+        "p95": float(np.percentile(durations, 95)*1000),
+        "p99": float(np.percentile(durations, 99)*1000),
+        "mean": float(durations.mean()*1000)
+    }
+    if windows is not None:
+        summary["windowsPerSecond"] = float(windows*len(durations)/durations.sum())
+    return summary
+
+def benchmark(pipeline: Pipeline, payload, iterations = 20, warmup = 3, no_answer_strategy = "ignore"):
+    """
+    Times the stages of the passed pipeline separately (LexicalFilter.filter_batch if the pre-filter is enabled, InputTokenizer.tokenize, model predict, OutputInterpreter.interpret_output)
+    as well as Pipeline.process for the passed payload. Each stage is run 'warmup' times before it is timed 'iterations' times.
+
+    Returns
+    -------
+    Dictionary with the number of windows (tokenized samples) of the payload and the summary (see 'summarize') of each stage
+    """
+    batch = pipeline.json_to_batch(pipeline.sort_schema_values(copy.deepcopy(payload)), no_answer_strategy, dict())
+    durations = {"prefilter": [], "tokenize": [], "predict": [], "interpret": [], "process": []}
+    for i in range(warmup + iterations):
+        prefilter_start = time.perf_counter()
+        filtered_batch = pipeline.lexical_filter.filter_batch(batch)[0] if pipeline.lexical_filter else batch
+        start = time.perf_counter()
+        tokenized_samples = pipeline.tokenizer.tokenize(filtered_batch)
+        tokenized = time.perf_counter()
+        output, batch_size = pipeline.model.predict(tokenized_samples)
+        predicted = time.perf_counter()
+        pipeline.interpreter.interpret_output(tokenized_samples, output, batch_size, no_answer_strategy)
+        interpreted = time.perf_counter()
+        pipeline.process(copy.deepcopy(payload), None, False, no_answer_strategy)
+        processed = time.perf_counter()
+        if i >= warmup:
+            durations["prefilter"].append(start-prefilter_start)
+            durations["tokenize"].append(tokenized-start)
+            durations["predict"].append(predicted-tokenized)
+            durations["interpret"].append(interpreted-predicted)
+            durations["process"].append(processed-interpreted)
+    windows = len(tokenized_samples["input_ids"])
+    return {
+        "windows": windows,
+        "stages": {stage: summarize(values, windows) for stage, values in durations.items() if stage != "prefilter" or pipeline.lexical_filter}
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the pipeline stages with synthetic payloads and reports the latency percentiles (ms) and windows per second as JSON")
+    parser.add_argument("--model", default=None, help="Checkpoint to benchmark (default: randomly initialized model of the same architecture, created offline in '--offline-dir')")
+    parser.add_argument("--offline-dir", default="benchmark-model", help="Directory of the offline checkpoint (created if it does not exist)")
+    parser.add_argument("--size", default="base", help="Size of the offline model: 'base' (architecture of the RESTBERTa checkpoints) or 'small'")
+    parser.add_argument("--backend", default="tf", help="'tf' (TensorFlow) or 'onnx' (ONNX Runtime)")
+    parser.add_argument("--onnx-path", default=None, help="Path of the ONNX model file (default: 'model.onnx' in the offline checkpoint directory or the working directory)")
+    parser.add_argument("--quantize", default=None, help="If set to 'int8', the 'onnx' backend serves the model with int8 weights")
+    parser.add_argument("--padding", default="dynamic", help="'max_length' or 'dynamic'")
+    parser.add_argument("--batch-size", type=int, default=32, help="Maximum number of tokenized samples that are fed into the model at once")
+    parser.add_argument("--prefilter-top-k", type=int, default=None, help="If set, only this number of properties that are lexically most similar to the query are fed into the model for longer schemas")
+    parser.add_argument("--kind", default="properties", help="'properties' (property lists) or 'endpoints' (endpoint lists)")
+    parser.add_argument("--schemas", type=int, default=1, help="Number of schemas per payload")
+    parser.add_argument("--elements", type=int, nargs="+", default=[10, 50, 200], help="Numbers of Web API elements per schema (one benchmark per number)")
+    parser.add_argument("--queries", type=int, default=5, help="Number of queries per schema")
+    parser.add_argument("--verbose", action="store_true", help="Set the verbose output flag of the queries")
+    parser.add_argument("--iterations", type=int, default=20, help="Number of timed runs per benchmark")
+    parser.add_argument("--warmup", type=int, default=3, help="Number of untimed runs per benchmark")
+    parser.add_argument("--output", default=None, help="Output JSON file (default: stdout)")
+    args = parser.parse_args()
+
+    if args.model:
+        model = args.model
+        tokenizer = "microsoft/codebert-base"
+        onnx_path = args.onnx_path or "model.onnx"
+    else:
+        model = tokenizer = create_offline_checkpoint(args.offline_dir, args.size)
+        onnx_path = args.onnx_path or os.path.join(model, "model.onnx")
+
+    # the pipeline is created without cache, since cached results would bypass the model
+    pipeline = Pipeline(model, padding=args.padding, batch_size=args.batch_size, backend=args.backend, onnx_path=onnx_path, quantize=args.quantize, tokenizer_checkpoint=tokenizer, prefilter_top_k=args.prefilter_top_k)
+
+    report = {
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "processor": platform.processor()},
+        "benchmarks": []
+    }
+    for n_elements in args.elements:
+        payload = generate_payload(args.schemas, n_elements, args.queries, args.kind, args.verbose)
+        result = benchmark(pipeline, payload, args.iterations, args.warmup)
+        result["elements"] = n_elements
+        report["benchmarks"].append(result)
+        print("Elements:", n_elements, "windows:", result["windows"], "process p50 (ms):", round(result["stages"]["process"]["p50"], 1), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
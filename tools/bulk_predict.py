@@ -0,0 +1,192 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from pipeline.pipeline import Pipeline, InvalidRequestException
+from pipeline.result_format import format_results_v1, serialize
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+# pipeline of the current (worker) process, which is created once per process by 'init_worker'
+pipeline = None
+prediction_args = None
+
+def init_worker(pipeline_args: dict, args: dict):
+    global pipeline, prediction_args
+    pipeline = Pipeline(**pipeline_args)
+    prediction_args = args
+
+def predict_line(numbered_line):
+    """
+    Processes a single line of the input file, i.e., a '/predict' payload, and returns the serialized results (or an error object) as a single line (bytes).
+    """
+    line_number, line = numbered_line
+    if not line.strip():
+        # an error object keeps the output lines aligned with the input lines
+        return serialize({"line": line_number, "error": "empty line"})+b"\n"
+    try:
+        input_dict = json.loads(line)
+        if not isinstance(input_dict, dict):
+            raise InvalidRequestException("The payload must be a JSON object.")
+        results = pipeline.process(input_dict,prediction_args["top"],prediction_args["suppress_duplicates"],prediction_args["no_answer_strategy"])
+        if not prediction_args.get("numeric"):
+            results = format_results_v1(results)
+    except (json.JSONDecodeError, InvalidRequestException, TypeError, AttributeError) as e:
+        # malformed payloads (e.g. a list instead of an object somewhere in the payload) do not abort the whole run
+        results = {
+            "line": line_number,
+            "error": e.message if isinstance(e, InvalidRequestException) else str(e)
+        }
+    return serialize(results)+b"\n"
+
+def read_checkpoint(path):
+    """
+    Returns the number of processed input lines and the size of the output file (in bytes) at the time of the last checkpoint
+    """
+    if path and os.path.exists(path):
+        with open(path) as file:
+            checkpoint = json.load(file)
+        return checkpoint["processedLines"], checkpoint["outputSize"]
+    return 0, 0
+
+def write_checkpoint(path, processed_lines, output_size):
+    # write to a temporary file first, so that the checkpoint is never corrupted by an interruption
+    with open(path+".tmp", "w") as file:
+        json.dump({"processedLines": processed_lines, "outputSize": output_size}, file)
+    os.replace(path+".tmp", path)
+
+def bulk_predict(input_file, output_file, pipeline_args: dict, prediction_args: dict, workers = 1, checkpoint_path = None, checkpoint_interval = 100):
+    """
+    Reads '/predict' payloads (one per line) from 'input_file' and writes the results (one per line, in the same order) to 'output_file'.
+
+    Parameters
+    ----------
+    input_file :
+        Input file (or stdin)
+    output_file :
+        Output file opened in binary mode (or stdout), in append mode when resuming from a checkpoint
+    pipeline_args : dict
+        Arguments of the pipeline that is created once per worker process
+    prediction_args : dict
+        Arguments 'top', 'suppress_duplicates', and 'no_answer_strategy' of 'Pipeline.process(...)'
+    workers : int
+        Number of worker processes (1 processes the input in the current process)
+    checkpoint_path : str
+        Path of the checkpoint file. If it exists, the lines processed according to the checkpoint are skipped and the output file is truncated to its size at the time of the checkpoint
+    checkpoint_interval : int
+        Number of lines after which a checkpoint is written
+
+    Returns
+    -------
+    The number of processed lines (including the lines skipped on resume)
+    """
+    processed_lines, output_size = read_checkpoint(checkpoint_path)
+    if processed_lines:
+        # results written after the last checkpoint are computed again
+        output_file.truncate(output_size)
+        print("Resuming after line", processed_lines, file=sys.stderr)
+
+    numbered_lines = itertools.islice(enumerate(input_file, start=1), processed_lines, None)
+
+    if workers > 1:
+        # 'spawn' (instead of 'fork') since neither TensorFlow nor ONNX Runtime are fork-safe once initialized
+        pool = multiprocessing.get_context("spawn").Pool(workers, initializer=init_worker, initargs=(pipeline_args, prediction_args))
+        # 'imap' returns the results in the order of the input lines
+        results = pool.imap(predict_line, numbered_lines)
+    else:
+        pool = None
+        init_worker(pipeline_args, prediction_args)
+        results = map(predict_line, numbered_lines)
+
+    try:
+        for result in results:
+            processed_lines += 1
+            if result:
+                output_file.write(result)
+            if checkpoint_path and processed_lines % checkpoint_interval == 0:
+                output_file.flush()
+                write_checkpoint(checkpoint_path, processed_lines, output_file.tell())
+        output_file.flush()
+        if checkpoint_path:
+            write_checkpoint(checkpoint_path, processed_lines, output_file.tell())
+    finally:
+        if pool:
+            pool.terminate()
+    return processed_lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Makes predictions for a JSONL file with one '/predict' payload per line and writes the results as JSONL (one result per line, in the order of the input)")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file with one '/predict' payload per line (default: stdin)")
+    parser.add_argument("--output", default="-", help="Output JSONL file (default: stdout)")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file for resuming an interrupted run (default: '<output>.checkpoint', disabled for stdout)")
+    parser.add_argument("--checkpoint-interval", type=int, default=100, help="Number of lines after which a checkpoint is written")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes, each loading the model once")
+    parser.add_argument("--batch-size", type=int, default=128, help="Maximum number of tokenized samples that are fed into the model at once")
+    parser.add_argument("--model", default="SebastianKotstein/restberta-qa-parameter-matching", help="Name of the checkpoint on Hugging Face or path to a local checkpoint")
+    parser.add_argument("--token", default=None, help="Optional Hugging Face access token")
+    parser.add_argument("--backend", default="tf", choices=["tf", "onnx"], help="'tf' (TensorFlow) or 'onnx' (ONNX Runtime)")
+    parser.add_argument("--onnx-path", default="model.onnx", help="Path of the ONNX model file (the checkpoint is exported if the file does not exist)")
+    parser.add_argument("--quantize", default=None, choices=["int8"], help="If set to 'int8', the 'onnx' backend serves the model with int8 weights")
+    parser.add_argument("--padding", default="dynamic", choices=["max_length", "dynamic"], help="'max_length' or 'dynamic'")
+    parser.add_argument("--best-size", type=int, default=20, help="Number of best start and end logits that are combined per tokenized sample")
+    parser.add_argument("--prefilter-top-k", type=int, default=None, help="If set, only this number of properties that are lexically most similar to the query are fed into the model for longer schemas")
+    parser.add_argument("--prefilter-min-properties", type=int, default=0, help="Minimum number of properties of a schema to be pre-filtered")
+    parser.add_argument("--top", type=int, default=None, help="Maximum number of answers per query")
+    parser.add_argument("--duplicates", default=None, help="If set to 'suppress', duplicates are removed from the ranked list of answers")
+    parser.add_argument("--no-answer-strategy", default="ignore", choices=["ignore", "treshold"], help="'ignore' or 'treshold'")
+    parser.add_argument("--numeric", action="store_true", help="Write scores and probabilities as numbers (v2 representation) instead of strings (v1 representation)")
+    args = parser.parse_args()
+
+    pipeline_args = {
+        "model_checkpoint": args.model,
+        "best_size": args.best_size,
+        "token": args.token,
+        "padding": args.padding,
+        "padding_buckets": [64,128,256,512],
+        "batch_size": args.batch_size,
+        "backend": args.backend,
+        "onnx_path": args.onnx_path,
+        "quantize": args.quantize,
+        "prefilter_top_k": args.prefilter_top_k,
+        "prefilter_min_properties": args.prefilter_min_properties
+    }
+    prediction_args = {
+        "top": args.top,
+        "suppress_duplicates": args.duplicates == "suppress",
+        "no_answer_strategy": args.no_answer_strategy,
+        "numeric": args.numeric
+    }
+
+    checkpoint_path = args.checkpoint
+    if not checkpoint_path and args.output != "-":
+        checkpoint_path = args.output+".checkpoint"
+
+    input_file = sys.stdin if args.input == "-" else open(args.input)
+    # without a checkpoint, an existing output file is overwritten instead of appending the results of a new run to it
+    output_mode = "ab" if read_checkpoint(checkpoint_path)[0] else "wb"
+    output_file = sys.stdout.buffer if args.output == "-" else open(args.output, output_mode)
+    try:
+        n = bulk_predict(input_file, output_file, pipeline_args, prediction_args, args.workers, checkpoint_path, args.checkpoint_interval)
+        print("Processed", n, "lines", file=sys.stderr)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout.buffer:
+            output_file.close()
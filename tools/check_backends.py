@@ -0,0 +1,137 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from pipeline.pipeline import Pipeline
+
+import argparse
+import copy
+import json
+
+import numpy as np
+
+# reference payloads (in the style of the examples of the Web UI) used if no payloads are specified
+REFERENCE_PAYLOADS = [
+    {
+        "schemas":[
+            {
+                "schemaId": "pm",
+                "value": "auth.key location.city location.city_id location.country location.lat location.lon location.postal_code state units",
+                "queries": [
+                    {"queryId": "q0", "value": "The ZIP of the city"},
+                    {"queryId": "q1", "value": "The API key"},
+                    {"queryId": "q2", "value": "Latitude of the location"},
+                    {"queryId": "q3", "value": "The country"},
+                    {"queryId": "q4", "value": "The unit system"}
+                ]
+            },
+            {
+                "schemaId": "ed",
+                "value": "auth.post users.get users.post users.{userId}.address.get users.{userId}.address.put users.{userId}.delete users.{userId}.get users.{userId}.put",
+                "queries": [
+                    {"queryId": "q0", "value": "Create a new user"},
+                    {"queryId": "q1", "value": "Delete a user"},
+                    {"queryId": "q2", "value": "Get the address of a user"},
+                    {"queryId": "q3", "value": "Update a user"},
+                    {"queryId": "q4", "value": "Login"}
+                ]
+            }
+        ]
+    }
+]
+
+def load_payloads(path):
+    payloads = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                payloads.append(json.loads(line))
+    return payloads
+
+def top_answer(query):
+    answers = query["result"]["answers"]
+    if answers:
+        return answers[0]["property"]["name"]
+    else:
+        return None
+
+def compare(reference: Pipeline, candidate: Pipeline, payloads):
+    """
+    Compares the candidate pipeline against the reference pipeline on the passed payloads.
+    The method returns a report with the deviation of the logits (over all non-padding tokens) and the agreement of the top-1 properties per query.
+    """
+    differences = []
+    n_queries = 0
+    n_agreements = 0
+    disagreements = []
+
+    for payload in payloads:
+        # compare logits for identical inputs
+        input_dict = reference.sort_schema_values(copy.deepcopy(payload))
+        tokenized_samples = reference.tokenizer.tokenize(reference.json_to_batch(input_dict, "ignore"))
+        reference_output, _ = reference.model.predict(tokenized_samples)
+        candidate_output, _ = candidate.model.predict(tokenized_samples)
+        mask = np.asarray(tokenized_samples["attention_mask"], dtype=bool)
+        for field in ["start_logits", "end_logits"]:
+            difference = np.abs(np.asarray(getattr(reference_output, field)) - np.asarray(getattr(candidate_output, field)))
+            differences.append(difference[mask])
+
+        # compare top-1 properties
+        reference_results = reference.process(copy.deepcopy(payload), 1, False, "ignore")
+        candidate_results = candidate.process(copy.deepcopy(payload), 1, False, "ignore")
+        for reference_schema, candidate_schema in zip(reference_results["schemas"], candidate_results["schemas"]):
+            for reference_query, candidate_query in zip(reference_schema["queries"], candidate_schema["queries"]):
+                n_queries += 1
+                if top_answer(reference_query) == top_answer(candidate_query):
+                    n_agreements += 1
+                else:
+                    disagreements.append({
+                        "schemaId": reference_schema["schemaId"],
+                        "queryId": reference_query["queryId"],
+                        "query": reference_query["value"],
+                        "reference": top_answer(reference_query),
+                        "candidate": top_answer(candidate_query)
+                    })
+
+    differences = np.concatenate(differences)
+    return {
+        "queries": n_queries,
+        "top1Agreement": n_agreements/n_queries if n_queries else None,
+        "maxAbsLogitDifference": float(differences.max()) if differences.size else None,
+        "meanAbsLogitDifference": float(differences.mean()) if differences.size else None,
+        "disagreements": disagreements
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the agreement of an inference backend (optionally quantized) with a reference backend, by default TensorFlow (fp32)")
+    parser.add_argument("--model", default="SebastianKotstein/restberta-qa-parameter-matching", help="Name of the checkpoint on Hugging Face or path to a local checkpoint")
+    parser.add_argument("--token", default=None, help="Optional Hugging Face access token")
+    parser.add_argument("--backend", default="onnx", help="Backend that is compared against the reference backend")
+    parser.add_argument("--quantize", default=None, help="If set to 'int8', the int8 model of the 'onnx' backend is compared against the reference backend")
+    parser.add_argument("--reference-backend", default="tf", help="Reference backend (fp32)")
+    parser.add_argument("--onnx-path", default="model.onnx", help="Path of the ONNX model file (the checkpoint is exported if the file does not exist)")
+    parser.add_argument("--payloads", default=None, help="JSONL file with one '/predict' payload per line (default: built-in reference payloads)")
+    parser.add_argument("--best-size", type=int, default=20, help="Number of best start and end logits that are combined per tokenized sample")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads) if args.payloads else REFERENCE_PAYLOADS
+    reference = Pipeline(args.model, args.best_size, None, args.token, schema_cache_size = 0, backend = args.reference_backend, onnx_path = args.onnx_path)
+    candidate = Pipeline(args.model, args.best_size, None, args.token, schema_cache_size = 0, backend = args.backend, onnx_path = args.onnx_path, quantize = args.quantize)
+
+    report = compare(reference, candidate, payloads)
+    report["model"] = args.model
+    report["reference"] = args.reference_backend
+    report["candidate"] = args.backend + (" ("+args.quantize+")" if args.quantize else "")
+    print(json.dumps(report, indent=2))
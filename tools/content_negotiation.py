@@ -35,22 +35,27 @@ def produces(*mime_types, default_mime_type = None, pass_negotiated_mime_type =
         def inner(*args, **kwargs):
             accepted = set(request.accept_mimetypes.values())
             if allow_empty_accept_header and not accepted:
+                if pass_negotiated_mime_type:
+                    kwargs["accept"] = default_mime_type if default_mime_type else mime_types[0]
                 res = fn(*args, **kwargs)
-                if default_mime_type:
-                    res.headers["Content-Type"] = default_mime_type
-                return res
+                return set_default_mime_type(res, default_mime_type)
             else:
                 supported = set(mime_types)
                 if len(accepted & supported) == 0:
                     raise NotAcceptable()
                 if pass_negotiated_mime_type:
-                    for accepted_mime_type in accepted:
+                    # values are ordered by quality, i.e., the client's most preferred media type is negotiated
+                    for accepted_mime_type in request.accept_mimetypes.values():
                         if accepted_mime_type in supported:
                             kwargs["accept"] = accepted_mime_type
                             break
                 res = fn(*args, **kwargs)
-                if default_mime_type:
-                    res.headers["Content-Type"] = default_mime_type
-                return res
+                return set_default_mime_type(res, default_mime_type)
         return inner
-    return decorated
\ No newline at end of file
+    return decorated
+
+def set_default_mime_type(res, default_mime_type):
+    # only generic JSON responses are relabeled, responses with a specific media type (e.g. a stream) keep theirs
+    if default_mime_type and res.mimetype == "application/json":
+        res.headers["Content-Type"] = default_mime_type
+    return res
@@ -0,0 +1,34 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from pipeline.onnx_qa_model import export_onnx_model, quantize_onnx_model, get_quantized_path
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports a RESTBERTa checkpoint into an ONNX model for the 'onnx' backend")
+    parser.add_argument("--model", default="SebastianKotstein/restberta-qa-parameter-matching", help="Name of the checkpoint on Hugging Face or path to a local checkpoint")
+    parser.add_argument("--output", required=True, help="Path of the ONNX model file")
+    parser.add_argument("--token", default=None, help="Optional Hugging Face access token")
+    parser.add_argument("--quantize", default=None, help="If set to 'int8', a model with int8 weights is additionally stored next to the exported model")
+    args = parser.parse_args()
+
+    export_onnx_model(args.model, args.output, args.token)
+    print("Exported "+args.model+" to "+args.output)
+    if args.quantize:
+        quantized_path = get_quantized_path(args.output, args.quantize)
+        quantize_onnx_model(args.output, quantized_path, args.quantize)
+        print("Quantized "+args.output+" to "+quantized_path)
@@ -0,0 +1,181 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+class JobLimitExceededException(Exception):
+    def __init__(self, message="Too many jobs") -> None:
+        self.message = message
+        super().__init__(self.message)
+
+class Job:
+    """
+    Prediction request that is processed in the background. The results are available as soon as the job's status is 'completed'.
+    """
+
+    def __init__(self, input_dict, results, total_queries) -> None:
+        self.id = str(uuid.uuid4())
+        self.status = STATUS_QUEUED
+        # validated request, the results of the queries are merged into it once all queries have been processed
+        self.input_dict = input_dict
+        # generator yielding the result of each query (see Pipeline.process_stream)
+        self.results = results
+        self.total_queries = total_queries
+        self.processed_queries = 0
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = threading.Event()
+
+    def is_finished(self):
+        return self.status in [STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED]
+
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "progress": {
+                "processedQueries": self.processed_queries,
+                "totalQueries": self.total_queries
+            },
+            "error": self.error,
+            "createdAt": format_timestamp(self.created_at),
+            "startedAt": format_timestamp(self.started_at),
+            "finishedAt": format_timestamp(self.finished_at)
+        }
+
+def format_timestamp(timestamp):
+    if timestamp:
+        return timestamp.strftime("%Y-%m-%dT%H:%M:%S")
+    return None
+
+class JobManager:
+    """
+    Processes prediction requests as jobs on a background thread pool, so that large requests do not block the (uwsgi) worker that receives them.
+
+    Parameters
+    ----------
+    registry : ModelRegistry
+        Registry providing the pipeline of the default model, which processes the jobs that do not specify a pipeline
+    max_workers : int
+        Maximum number of jobs that are processed concurrently
+    max_jobs : int
+        Maximum number of jobs that are kept (finished jobs are discarded in order of their creation if this number is exceeded)
+    """
+
+    def __init__(self, registry, max_workers = 1, max_jobs = 100) -> None:
+        # the pipeline is looked up on each submission, so that the job manager does not keep an evicted model alive
+        self.registry = registry
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def submit(self, input_dict, top = None, suppress_duplicates = False, no_answer_strategy = None, pipeline = None):
+        """
+        Validates the passed request and enqueues it as a job, which is processed by the passed pipeline (default: the pipeline of the registry's default model).
+        Raises an InvalidRequestException if the request is invalid and a JobLimitExceededException if 'max_jobs' unfinished jobs exist.
+
+        Returns
+        -------
+        The created job
+        """
+        # the request is validated (and completed with IDs and names) before the generator is returned
+        if pipeline is None:
+            pipeline = self.registry.get()
+        results = pipeline.process_stream(input_dict,top,suppress_duplicates,no_answer_strategy)
+        total_queries = sum([len(schema["queries"]) for schema in input_dict["schemas"]])
+        job = Job(input_dict, results, total_queries)
+        with self.lock:
+            if len(self.jobs) >= self.max_jobs:
+                for finished_job in [existing_job for existing_job in self.jobs.values() if existing_job.is_finished()]:
+                    del self.jobs[finished_job.id]
+                    if len(self.jobs) < self.max_jobs:
+                        break
+            if len(self.jobs) >= self.max_jobs:
+                results.close()
+                raise JobLimitExceededException("The maximum number of unfinished jobs ("+str(self.max_jobs)+") has been reached.")
+            self.jobs[job.id] = job
+        self.executor.submit(self.run, job)
+        return job
+
+    def run(self, job: Job):
+        if job.cancelled.is_set():
+            return
+        job.status = STATUS_RUNNING
+        job.started_at = datetime.utcnow()
+        try:
+            # results are merged by (schemaId, queryId) like in Pipeline.merge_results_w_input_json
+            queries = dict()
+            for schema in job.input_dict["schemas"]:
+                for query in schema["queries"]:
+                    queries[(schema["schemaId"], query["queryId"])] = query
+            for item in job.results:
+                if job.cancelled.is_set():
+                    job.results.close()
+                    return
+                queries[(item["schemaId"], item["queryId"])]["result"] = item["result"]
+                job.processed_queries += 1
+            job.status = STATUS_COMPLETED
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = STATUS_FAILED
+        finally:
+            # the generator is no longer needed (and holds the tokenized samples of the current chunk)
+            job.results = None
+            job.finished_at = datetime.utcnow()
+
+    def get(self, id):
+        with self.lock:
+            return self.jobs.get(id)
+
+    def delete(self, id):
+        """
+        Removes the job with the passed ID. If the job is still queued or running, it is cancelled.
+
+        Returns
+        -------
+        True if the job existed, False otherwise
+        """
+        with self.lock:
+            job = self.jobs.pop(id, None)
+        if job is None:
+            return False
+        if not job.is_finished():
+            job.cancelled.set()
+            job.status = STATUS_CANCELLED
+        return True
+
+    def queue_depth(self):
+        """
+        Returns the number of jobs that are queued or running
+        """
+        with self.lock:
+            return len([job for job in self.jobs.values() if not job.is_finished()])
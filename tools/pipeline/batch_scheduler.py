@@ -0,0 +1,178 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from .model_output import QAModelOutput
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+class PredictionRequest:
+
+    def __init__(self, input_ids, attention_mask) -> None:
+        self.input_ids = input_ids
+        self.attention_mask = attention_mask
+        self.start_logits = None
+        self.end_logits = None
+        self.error = None
+        self.done = threading.Event()
+
+class BatchScheduler:
+    """
+    Scheduler in front of a QAModel that gathers the tokenized samples of concurrent requests into shared model batches.
+    A batch is passed to the model as soon as it contains 'max_batch_size' tokenized samples or the first request of the batch has waited for 'max_wait' seconds.
+    The scheduler provides the same 'predict' method as the QAModel and returns the logits of each request to the thread that has submitted it.
+    """
+
+    def __init__(self, model, max_batch_size = 32, max_wait = 0.01, pad_token_id = 1, metrics = None) -> None:
+        self.model = model
+        # optional Metrics recording the size of the shared batches
+        self.metrics = metrics
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pad_token_id = pad_token_id
+
+        self.requests = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+        # set by 'close', requests submitted afterwards are passed to the model directly
+        self.closed = False
+
+    def predict(self, batched_samples):
+        """
+        Submits the passed batch of tokenized samples to the scheduler and blocks until the model has processed it (together with the samples of other requests).
+        The method returns the model's output for the passed samples as well as the number of input samples.
+
+        Parameters
+        ----------
+        batched_samples : [dict()]
+            Batch of samples where each sample is a dictionary have the fields 'attention_mask' and 'input_ids'
+
+        Returns
+        -------
+        The output of the model (first return parameter) and the number of input samples (second return parameter)
+        """
+        request = PredictionRequest(
+            np.asarray(batched_samples["input_ids"], dtype=np.int32),
+            np.asarray(batched_samples["attention_mask"], dtype=np.int32)
+        )
+        with self.lock:
+            closed = self.closed
+            if not closed:
+                # start worker thread lazily (i.e., in the process that serves the requests and not in a process that forks it)
+                self.start_worker()
+                # enqueued while holding the lock, i.e., before the 'None' of 'close', so that the worker processes the request before it stops
+                self.requests.put(request)
+        if closed:
+            # the model has been closed (e.g. evicted) while the calling request still holds the pipeline
+            return self.model.predict(batched_samples)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return QAModelOutput(request.start_logits, request.end_logits), request.input_ids.shape[0]
+
+    def queue_depth(self):
+        """
+        Returns the number of requests that are waiting to be passed to the model.
+        """
+        return self.requests.qsize()
+
+    def post_fork(self, intra_op_threads = None):
+        # threads do not survive a fork, i.e., the worker thread (and its state) is recreated on the next request
+        self.requests = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+        self.closed = False
+        self.model.post_fork(intra_op_threads)
+
+    def memory_size(self):
+        return self.model.memory_size()
+
+    def close(self):
+        # the worker thread stops after processing the pending requests, requests that are submitted afterwards bypass the scheduler (see predict)
+        with self.lock:
+            self.closed = True
+            self.requests.put(None)
+        self.model.close()
+
+    def start_worker(self):
+        # the lock must be held by the caller
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self.run, name="batch-scheduler", daemon=True)
+            self.worker.start()
+
+    def run(self):
+        while True:
+            # wait for the first request of the next batch ('None' stops the worker, see close)
+            pending = [self.requests.get()]
+            if pending[0] is None:
+                return
+            n_samples = pending[0].input_ids.shape[0]
+            deadline = time.monotonic() + self.max_wait
+
+            # gather further requests until the batch is full or the first request has waited long enough
+            while n_samples < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    # stop after processing the gathered requests
+                    self.requests.put(None)
+                    break
+                pending.append(request)
+                n_samples += request.input_ids.shape[0]
+
+            self.process(pending)
+
+    def process(self, pending):
+        try:
+            # requests may have been padded to different lengths, therefore pad all samples to the longest one
+            # (additional padding tokens are masked and do not change the logits of the other tokens)
+            padded_length = max([request.input_ids.shape[1] for request in pending])
+            input_ids = np.full((sum([request.input_ids.shape[0] for request in pending]), padded_length), self.pad_token_id, dtype=np.int32)
+            attention_mask = np.zeros(input_ids.shape, dtype=np.int32)
+            offset = 0
+            for request in pending:
+                n, length = request.input_ids.shape
+                input_ids[offset:offset+n, :length] = request.input_ids
+                attention_mask[offset:offset+n, :length] = request.attention_mask
+                offset += n
+
+            if self.metrics:
+                self.metrics.batch_size.observe(input_ids.shape[0])
+            output, _ = self.model.predict({"input_ids": input_ids, "attention_mask": attention_mask})
+            start_logits = np.asarray(output.start_logits)
+            end_logits = np.asarray(output.end_logits)
+
+            # return the logits of each request to the thread that has submitted the request
+            offset = 0
+            for request in pending:
+                n, length = request.input_ids.shape
+                request.start_logits = start_logits[offset:offset+n, :length]
+                request.end_logits = end_logits[offset:offset+n, :length]
+                offset += n
+        except Exception as e:
+            for request in pending:
+                request.error = e
+        finally:
+            for request in pending:
+                request.done.set()
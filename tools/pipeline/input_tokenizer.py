@@ -19,11 +19,44 @@ import numpy as np
 
 class InputTokenizer: 
 
-    def __init__(self, base_model: str, max_length: int = 512, doc_stride: int = 128):
+    def __init__(self, base_model: str, max_length: int = 512, doc_stride: int = 128, padding: str = "max_length", padding_buckets = None, schema_cache = None):
         self.tokenizer = AutoTokenizer.from_pretrained(base_model)
         #self.tokenizer.save_pretrained("/home/user/2023_02_16_QA/checkpoints")
         self.max_length = max_length
         self.doc_stride = doc_stride
+        # 'max_length' pads every tokenized sample to 'max_length', 'dynamic' pads the tokenized samples of a batch only to the length of the longest one
+        if padding != "max_length" and padding != "dynamic":
+            raise ValueError("Invalid padding mode '"+str(padding)+"'. Allowed values are 'max_length' and 'dynamic'.")
+        self.padding = padding
+        # sorted list of lengths a dynamically padded batch is rounded up to (the model input size is always the last bucket)
+        self.padding_buckets = sorted(set([b for b in (padding_buckets or []) if b < max_length] + [max_length]))
+        # optional SchemaCache: if set, each paragraph is tokenized only once and its tokens are combined with the tokens of each query
+        self.schema_cache = schema_cache
+
+
+    def get_padded_length(self, longest_length: int):
+        """
+        Returns the length to which all tokenized samples of a batch are padded if the longest tokenized sample of this batch has the passed length.
+        If padding mode 'max_length' is set, the method always returns 'max_length'. If padding mode 'dynamic' is set, the method returns the smallest padding bucket
+        that is greater than or equal to the passed length (or the passed length itself if no padding buckets have been specified).
+
+        Parameters
+        ----------
+        longest_length : int
+            Number of tokens of the longest tokenized sample of the batch
+
+        Returns
+        -------
+        Length of the padded tokenized samples
+        """
+        if self.padding == "max_length":
+            return self.max_length
+        if len(self.padding_buckets) == 1:
+            return longest_length
+        for bucket in self.padding_buckets:
+            if bucket >= longest_length:
+                return bucket
+        return self.max_length
 
 
     def mask_offset_mapping(self, sequence_ids, offset_mapping):
@@ -74,21 +107,129 @@ class InputTokenizer:
         return tokens_of_fragments, fragment
 
 
+    def tokenize_paragraph(self, paragraph: str):
+        """
+        Tokenizes the passed paragraph without special tokens and returns its input indices and offset mapping.
+        """
+        tokenized_paragraph = self.tokenizer(paragraph, add_special_tokens=False, return_offsets_mapping=True)
+        return tokenized_paragraph["input_ids"], tokenized_paragraph["offset_mapping"]
+
+    def get_fragment_boundaries(self, n_tokens: int, fragment_length: int):
+        """
+        Splits a paragraph consisting of 'n_tokens' tokens into fragments with at most 'fragment_length' tokens that overlap by 'doc_stride' tokens.
+        The method returns the list of (start, end) token indices of the fragments. The fragments are identical to the fragments created by the tokenizer
+        if the paragraph is truncated with strategy 'only_second'.
+
+        Parameters
+        ----------
+        n_tokens : int
+            Number of tokens of the paragraph
+        fragment_length : int
+            Maximum number of tokens of a fragment, i.e., 'max_length' minus the number of tokens of the query and special tokens
+
+        Returns
+        -------
+        List of (start, end) token indices
+        """
+        if fragment_length <= self.doc_stride:
+            raise ValueError("The query is too long: a fragment of the paragraph ("+str(fragment_length)+" tokens) must be longer than 'doc_stride' ("+str(self.doc_stride)+" tokens).")
+        boundaries = []
+        for start in range(0, max(n_tokens, 1), fragment_length - self.doc_stride):
+            end = min(start + fragment_length, n_tokens)
+            boundaries.append((start, end))
+            if end == n_tokens:
+                break
+        return boundaries
+
+    def encode_with_schema_cache(self, batch):
+        """
+        Creates the tokenized samples of the passed batch like the tokenizer, but tokenizes each paragraph only once (the tokens and fragment boundaries of a paragraph are
+        stored in the schema cache, unless the paragraph is marked as not cacheable by the optional field 'qa_sample_paragraph_cacheable') and combines its fragments with the tokens of each query. The method returns the tokenized samples (without padding) as dictionary
+        with the fields 'input_ids', 'attention_mask', 'offset_mapping', and 'overflow_to_sample_mapping' as well as the list of sequence ids of each tokenized sample.
+        """
+        tokenized_samples = {
+            "input_ids": [],
+            "attention_mask": [],
+            "offset_mapping": [],
+            "overflow_to_sample_mapping": []
+        }
+        all_sequence_ids = []
+        n_special_tokens = self.tokenizer.num_special_tokens_to_add(pair=True)
+
+        tokenized_queries = self.tokenizer(batch["qa_sample_query"], add_special_tokens=False, return_offsets_mapping=True)
+        cacheable = batch.get("qa_sample_paragraph_cacheable")
+        
+        for sample_index, paragraph in enumerate(batch["qa_sample_paragraph"]):
+            query_ids = tokenized_queries["input_ids"][sample_index]
+            query_offset_mapping = tokenized_queries["offset_mapping"][sample_index]
+
+            fragment_length = self.max_length - len(query_ids) - n_special_tokens
+            if cacheable is None or cacheable[sample_index]:
+                paragraph_ids, paragraph_offset_mapping = self.schema_cache.get(paragraph, "tokens", lambda: self.tokenize_paragraph(paragraph))
+                boundaries = self.schema_cache.get(paragraph, ("fragments", fragment_length), lambda: self.get_fragment_boundaries(len(paragraph_ids), fragment_length))
+            else:
+                paragraph_ids, paragraph_offset_mapping = self.tokenize_paragraph(paragraph)
+                boundaries = self.get_fragment_boundaries(len(paragraph_ids), fragment_length)
+
+            for start, end in boundaries:
+                fragment_ids = paragraph_ids[start:end]
+                # build input sequence with placeholders (-1 for tokens of the query, -2 for tokens of the fragment) to determine the positions of the special tokens
+                template = self.tokenizer.build_inputs_with_special_tokens([-1]*len(query_ids), [-2]*len(fragment_ids))
+
+                # replace placeholders and assign tokens of query (0), paragraph (1), and special tokens (None) in the same way as the tokenizer does
+                input_ids = []
+                sequence_ids = []
+                offset_mapping = []
+                query_index = 0
+                fragment_index = 0
+                for token_id in template:
+                    if token_id == -1:
+                        input_ids.append(query_ids[query_index])
+                        sequence_ids.append(0)
+                        offset_mapping.append(tuple(query_offset_mapping[query_index]))
+                        query_index += 1
+                    elif token_id == -2:
+                        input_ids.append(fragment_ids[fragment_index])
+                        sequence_ids.append(1)
+                        offset_mapping.append(tuple(paragraph_offset_mapping[start + fragment_index]))
+                        fragment_index += 1
+                    else:
+                        input_ids.append(token_id)
+                        sequence_ids.append(None)
+                        offset_mapping.append((0, 0))
+
+                tokenized_samples["input_ids"].append(input_ids)
+                tokenized_samples["attention_mask"].append([1]*len(input_ids))
+                if "token_type_ids" in self.tokenizer.model_input_names:
+                    tokenized_samples.setdefault("token_type_ids", []).append(self.tokenizer.create_token_type_ids_from_sequences(query_ids, fragment_ids))
+                tokenized_samples["offset_mapping"].append(offset_mapping)
+                tokenized_samples["overflow_to_sample_mapping"].append(sample_index)
+                all_sequence_ids.append(sequence_ids)
+        
+        return tokenized_samples, all_sequence_ids
+
     def tokenize(self, batch):
 
         # Tokenizes the QA samples of the passed batch. Each QA sample may result into multiple tokenized samples if the input sequence, consisting of query and paragraph, exceeds the model's input size (typically 512 tokens). 
         # If a QA sample must be split into multiple tokenized samples, only the paragraph will be split by the tokenizer so that every resulting tokenized sample will contain the original query plus another fragment of the original paragraph. 
         # Note that the resulting fragments overlap by the number of tokens specifiec in 'doc_stride'. Example: If a 'doc_stride' of 128 is set, the second fragment will start with the last 128 tokens of the first fragment, and so further.
-        tokenized_samples = self.tokenizer(
-            batch["qa_sample_query"],
-            batch["qa_sample_paragraph"],
-            truncation="only_second",
-            max_length=self.max_length,
-            stride=self.doc_stride,
-            return_overflowing_tokens=True,
-            return_offsets_mapping=True,
-            padding="max_length",
-        )
+        if self.schema_cache is not None:
+            tokenized_samples, all_sequence_ids = self.encode_with_schema_cache(batch)
+        else:
+            tokenized_samples = self.tokenizer(
+                batch["qa_sample_query"],
+                batch["qa_sample_paragraph"],
+                truncation="only_second",
+                max_length=self.max_length,
+                stride=self.doc_stride,
+                return_overflowing_tokens=True,
+                return_offsets_mapping=True,
+                padding=False,
+            )
+            all_sequence_ids = [tokenized_samples.sequence_ids(i) for i in range(len(tokenized_samples["input_ids"]))]
+
+        # Length of the padded tokenized samples (the tokenized samples are padded below, since the tokenizer cannot pad to buckets)
+        padded_length = self.get_padded_length(max([len(input_ids) for input_ids in tokenized_samples["input_ids"]], default=0))
 
         # ID of the sample (string), e.g. "7fed77b9abe24a2db869c8b9919a1e9b"
         tokenized_samples["qa_sample_id"] = []
@@ -123,7 +264,7 @@ class InputTokenizer:
             
             # Mask offset mapping
             masked_offset_mapping = self.mask_offset_mapping(
-                sequence_ids = tokenized_samples.sequence_ids(i),
+                sequence_ids = all_sequence_ids[i],
                 offset_mapping = offset_mapping)
 
             # Load the index of the original QA-sample
@@ -131,6 +272,19 @@ class InputTokenizer:
 
             # Load cls_index
             cls_index = tokenized_samples["input_ids"][i].index(self.tokenizer.cls_token_id)
+
+            # extract fragment from input sequence (before padding, since the sequence ids are not padded)
+            if batch["verbose_output"][sample_index]:
+                tokens_of_fragments, fragment = self.extract_fragment(all_sequence_ids[i],tokenized_samples["input_ids"][i])
+
+            # pad tokenized sample to the length of the batch
+            padding_length = padded_length - len(tokenized_samples["input_ids"][i])
+            if padding_length > 0:
+                tokenized_samples["input_ids"][i] = tokenized_samples["input_ids"][i] + [self.tokenizer.pad_token_id]*padding_length
+                tokenized_samples["attention_mask"][i] = tokenized_samples["attention_mask"][i] + [0]*padding_length
+                if "token_type_ids" in tokenized_samples:
+                    tokenized_samples["token_type_ids"][i] = tokenized_samples["token_type_ids"][i] + [self.tokenizer.pad_token_type_id]*padding_length
+                masked_offset_mapping = masked_offset_mapping + [None]*padding_length
     
             # overwrite offset_mapping
             tokenized_samples["offset_mapping"][i] = masked_offset_mapping
@@ -139,6 +293,9 @@ class InputTokenizer:
             tokenized_samples["qa_sample_id"].append(batch["qa_sample_id"][sample_index])
             # append title of the QA sample
             tokenized_samples["qa_sample_title"].append(batch["qa_sample_title"][sample_index])
+            # append whether the paragraph of the QA sample may be stored in the schema cache (only if the batch specifies it, see LexicalFilter)
+            if "qa_sample_paragraph_cacheable" in batch:
+                tokenized_samples.setdefault("qa_sample_paragraph_cacheable", []).append(batch["qa_sample_paragraph_cacheable"][sample_index])
             # append query of the QA sample
             tokenized_samples["qa_sample_query"].append(batch["qa_sample_query"][sample_index])
 
@@ -151,8 +308,6 @@ class InputTokenizer:
 
             if batch["verbose_output"][sample_index]:
                 
-                # extract fragment from input sequence
-                tokens_of_fragments, fragment = self.extract_fragment(tokenized_samples.sequence_ids(i),tokenized_samples["input_ids"][i])
                 # convert all input indices into their token representation, i.e., list of strings
                 tokens = self.tokenizer.convert_ids_to_tokens(tokenized_samples["input_ids"][i])
 
@@ -0,0 +1,214 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from collections import Counter
+import re
+
+import numpy as np
+
+def normalize(text: str):
+    """
+    Splits the passed text into lowercase words, e.g., 'users[*].postalCode' into ['users', 'postal', 'code']
+    """
+    # split camel case, e.g. 'postalCode' into 'postal Code'
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def extract_ngrams(text: str, n = 3):
+    """
+    Returns the character n-grams of the words of the passed text (each word is padded with a space on both sides, so that short words have n-grams as well)
+    """
+    ngrams = []
+    for word in normalize(text):
+        word = " "+word+" "
+        ngrams.extend([word[k:k+n] for k in range(max(1, len(word)-n+1))])
+    return ngrams
+
+class LexicalIndex:
+    """
+    Character n-gram index (TF-IDF weighted inverted index) of the properties of a context (i.e., all sequences of characters that are separated by spaces).
+    The index is built once per context and scores all properties for a query by visiting only the properties that share an n-gram with the query.
+    """
+
+    def __init__(self, context: str, n = 3) -> None:
+        self.context = context
+        self.n = n
+        # start index (inclusive) and end index (exclusive) of each property on character level, both in ascending order
+        self.starts = []
+        self.ends = []
+        ngram_counts = []
+        for match in re.finditer(r"[^ ]+", context):
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+            ngram_counts.append(Counter(extract_ngrams(match.group(), n)))
+        self.start_vector = np.asarray(self.starts, dtype=np.int64)
+        self.end_vector = np.asarray(self.ends, dtype=np.int64)
+
+        # inverse document frequency of each n-gram
+        document_frequencies = Counter([ngram for counts in ngram_counts for ngram in counts])
+        self.idf = {ngram: np.log(1 + len(ngram_counts)/frequency) for ngram, frequency in document_frequencies.items()}
+
+        # postings of each n-gram: indices of the properties containing the n-gram and the weight of the n-gram in these properties (normalized per property)
+        postings = dict()
+        for k, counts in enumerate(ngram_counts):
+            weights = {ngram: count*self.idf[ngram] for ngram, count in counts.items()}
+            norm = np.sqrt(sum([weight*weight for weight in weights.values()])) or 1.0
+            for ngram, weight in weights.items():
+                postings.setdefault(ngram, ([], []))
+                postings[ngram][0].append(k)
+                postings[ngram][1].append(weight/norm)
+        self.postings = {ngram: (np.asarray(indices, dtype=np.int64), np.asarray(weights)) for ngram, (indices, weights) in postings.items()}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def score(self, query: str):
+        """
+        Returns the cosine similarity of the n-gram vector of the passed query and the n-gram vector of each property
+        """
+        scores = np.zeros(len(self.starts))
+        for ngram, count in Counter(extract_ngrams(query, self.n)).items():
+            if ngram in self.postings:
+                indices, weights = self.postings[ngram]
+                # each property occurs at most once per n-gram, i.e., the scores can be updated without 'np.add.at'
+                scores[indices] += count*self.idf[ngram]*weights
+        return scores
+
+    def select(self, query: str, top_k: int):
+        """
+        Returns the indices of the 'top_k' properties that are most similar to the passed query in the order of their occurrence in the context
+        (properties with equal scores are selected in the order of their occurrence)
+        """
+        scores = self.score(query)
+        selected = np.argsort(-scores, kind="stable")[:top_k]
+        return np.sort(selected)
+
+class Selection:
+    """
+    Shortened paragraph consisting of selected properties of an original paragraph. Maps character indices in the shortened paragraph back to the original paragraph.
+    """
+
+    def __init__(self, index: LexicalIndex, selected) -> None:
+        self.original_paragraph = index.context
+        self.selected = np.asarray(selected, dtype=np.int64)
+        lengths = index.end_vector[self.selected] - index.start_vector[self.selected]
+        # the selected properties are joined by single spaces
+        self.starts = np.concatenate([[0], np.cumsum(lengths + 1)[:-1]]).astype(np.int64) if len(lengths) else np.zeros(0, dtype=np.int64)
+        # shift of each selected property from the shortened to the original paragraph
+        self.shifts = index.start_vector[self.selected] - self.starts
+        self.paragraph = " ".join([index.context[index.starts[k]:index.ends[k]] for k in self.selected])
+
+    def map_start(self, char_index: int):
+        """
+        Maps a start index (inclusive) on character level in the shortened paragraph to the original paragraph
+        """
+        k = max(int(np.searchsorted(self.starts, char_index, side="right")) - 1, 0)
+        return int(char_index + self.shifts[k])
+
+    def map_end(self, char_index: int):
+        """
+        Maps an end index (exclusive) on character level in the shortened paragraph to the original paragraph, i.e., the end of a property is mapped to the end of the same property
+        """
+        return self.map_start(char_index - 1) + 1
+
+    def map_answer(self, answer):
+        """
+        Returns a copy of the passed answer (see OutputInterpreter.get_answers) with character indices, span, and property referring to the original paragraph.
+        A span covering multiple properties of the shortened paragraph covers all properties in between in the original paragraph.
+        """
+        if answer["property"] is None:
+            # the indices of the NULL answer refer to the CLS token
+            return answer
+        start_char_index = self.map_start(answer["start_char_index"])
+        end_char_index = self.map_end(answer["end_char_index"])
+        answer = dict(answer, span=self.original_paragraph[start_char_index:end_char_index], start_char_index=start_char_index, end_char_index=end_char_index)
+        # the covered part of the property lies within a single property, i.e., both indices are shifted by the same offset
+        shift = self.map_start(answer["property"]["start_char_index"]) - answer["property"]["start_char_index"]
+        answer["property"] = dict(answer["property"], start_char_index=answer["property"]["start_char_index"]+shift, end_char_index=answer["property"]["end_char_index"]+shift)
+        return answer
+
+class LexicalFilter:
+    """
+    Optional retrieval stage before the tokenization: for long paragraphs, only the 'top_k' properties that are lexically most similar to the query (see LexicalIndex)
+    are fed into the model. This bounds the number of tokenized samples (windows) per query independently of the size of the schema at the cost of recall,
+    since properties without lexical overlap with the query are never suggested.
+    """
+
+    def __init__(self, top_k: int, min_properties = 0, schema_cache = None, n = 3) -> None:
+        """
+        Parameters
+        ----------
+        top_k : int
+            Number of properties that are kept per query
+        min_properties : int
+            Minimum number of properties of a paragraph to be filtered (paragraphs with at most 'top_k' properties are never filtered)
+        schema_cache : SchemaCache
+            Optional cache for storing the LexicalIndex of each paragraph
+        n : int
+            Length of the character n-grams
+        """
+        self.top_k = top_k
+        self.min_properties = min_properties
+        self.schema_cache = schema_cache
+        self.n = n
+
+    def get_lexical_index(self, paragraph: str):
+        if self.schema_cache is not None:
+            return self.schema_cache.get(paragraph, ("lexical_index", self.n), lambda: LexicalIndex(paragraph, self.n))
+        return LexicalIndex(paragraph, self.n)
+
+    def filter_batch(self, batch):
+        """
+        Returns a copy of the passed batch (see Pipeline.json_to_batch) in which long paragraphs are replaced by shortened paragraphs per query, and the selection of each QA sample
+        (None if its paragraph has not been shortened), which is required for restoring the results (see 'restore_results').
+        The field 'qa_sample_paragraph_cacheable' of the copy marks the QA samples whose paragraph has not been shortened and may therefore be stored in the schema cache.
+        """
+        filtered_batch = {key: list(values) for key, values in batch.items()}
+        selections = []
+        for i, paragraph in enumerate(batch["qa_sample_paragraph"]):
+            # counting the separators is cheaper than building the index for paragraphs that are too short anyway
+            n_properties = len(paragraph.split())
+            if n_properties <= self.top_k or n_properties < self.min_properties:
+                selections.append(None)
+                continue
+            index = self.get_lexical_index(paragraph)
+            selection = Selection(index, index.select(batch["qa_sample_query"][i], self.top_k))
+            filtered_batch["qa_sample_paragraph"][i] = selection.paragraph
+            selections.append(selection)
+        # shortened paragraphs differ per query, i.e., storing their artifacts in the schema cache would only evict the artifacts of the original paragraphs
+        filtered_batch["qa_sample_paragraph_cacheable"] = [selection is None for selection in selections]
+        return filtered_batch, selections
+
+    def restore_results(self, batch, selections, results):
+        """
+        Maps the answers of the passed results (see OutputInterpreter.interpret_output) of a filtered batch back to the original paragraphs
+        """
+        # selection per QA sample, identified by (paragraph ID, sample ID) like the results
+        selections = {(paragraph_id, sample_id): selection for paragraph_id, sample_id, selection in zip(batch["qa_sample_paragraph_id"], batch["qa_sample_id"], selections) if selection is not None}
+        for k in range(len(results["qa_sample_id"])):
+            selection = selections.get((results["qa_sample_paragraph_id"][k], results["qa_sample_id"][k]))
+            if selection is None:
+                continue
+            results["qa_sample_paragraph"][k] = selection.original_paragraph
+            # the aggregated answers are shared with the answers of the tokenized samples, i.e., each answer is mapped only once
+            # (the original answer is kept together with its mapped copy so that its ID is not reused while mapping)
+            mapped_answers = dict()
+            for tokenized_sample in results["tokenized_samples"][k]:
+                for answer in tokenized_sample["answers"]:
+                    mapped_answers[id(answer)] = (answer, selection.map_answer(answer))
+                tokenized_sample["answers"] = [mapped_answers[id(answer)][1] for answer in tokenized_sample["answers"]]
+            results["answers"][k] = [mapped_answers[id(answer)][1] if id(answer) in mapped_answers else selection.map_answer(answer) for answer in results["answers"][k]]
+        return results
@@ -14,7 +14,14 @@ Copyright 2023 Sebastian Kotstein
    limitations under the License.
 '''
 
+import hashlib
+import json
 import uuid
+import threading
+from collections import OrderedDict
+
+# maximum number of characters of a schema that are kept for displaying a cached item
+SCHEMA_PREVIEW_LENGTH = 100
 
 class LRUCache:
 
@@ -22,89 +29,169 @@ class LRUCache:
         self.max_size = max_size
         self.access_counter = 0
 
-        self.results = dict()
-        self.verbose_info = dict()
-        self.access_counters = dict()
-        self.keys_to_ids = dict()
+        # cache entries in order of their last access (least recently used entry first), each entry is a dictionary with the fields 'id', 'description', 'result', 'verbose', and 'priority'
+        self.entries = OrderedDict()
         self.ids_to_keys = dict()
         self.debug = debug
 
-    def has(self, schema: str, query: str, no_answer_strategy: str, verbose: bool):
-        key = self.generate_key(schema,query,no_answer_strategy)
-        if verbose:
-            if key in self.results and self.verbose_info[key]:
-                return True
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # all public methods are synchronized since the cache is shared by all threads of a worker
+        self.lock = threading.RLock()
+
+    def has(self, schema: str, query: str, no_answer_strategy: str, verbose: bool, model: str = None):
+        key = self.generate_key(schema,query,no_answer_strategy,model)
+        with self.lock:
+            if key in self.entries:
+                return not verbose or self.entries[key]["verbose"]
             else:
                 return False
-        else:
-            if key in self.results:
-                return True
+
+    def get(self, schema: str, query: str, no_answer_strategy: str, verbose: bool, model: str = None):
+        """
+        Looks up and loads the result for the passed schema, query, and no-answer strategy in one step and updates the hit/miss statistics.
+        The method returns a copy of the cached result or 'None' if the cache does not contain a result or only a non-verbose result although a verbose result is requested.
+        """
+        key = self.generate_key(schema,query,no_answer_strategy,model)
+        with self.lock:
+            if key in self.entries and (not verbose or self.entries[key]["verbose"]):
+                self.hits+=1
+                return self.touch(key)["result"].copy()
             else:
-                return False
+                self.misses+=1
+                return None
+
+    def load(self, schema: str, query: str, no_answer_strategy:str, model: str = None):
+        key = self.generate_key(schema,query,no_answer_strategy,model)
+        with self.lock:
+            if key in self.entries:
+                if self.debug:
+                    print("Load "+key)
+                return self.touch(key)["result"].copy()
+            else:
+                if self.debug:
+                    print("Load "+key+" - not found")
+                return None
+
+    def store(self, schema: str, query: str, no_answer_strategy: str, result, verbose: bool, model: str = None):
+        key = self.generate_key(schema,query,no_answer_strategy,model)
+        with self.lock:
+            if key in self.entries:
+                entry = self.touch(key)
+            else:
+                # evict least recently used entry
+                while self.entries and len(self.entries) >= self.max_size:
+                    self.evict(next(iter(self.entries)))
+                entry = {
+                    "id": str(uuid.uuid4()),
+                    "description": self.describe_key(schema,query,no_answer_strategy,model),
+                    "priority": None
+                }
+                self.entries[key] = entry
+                self.ids_to_keys[entry["id"]] = key
+                self.touch(key)
 
-    def load(self, schema: str, query: str, no_answer_strategy:str):
-        key = self.generate_key(schema,query,no_answer_strategy)
-        if self.has(schema,query,no_answer_strategy,False):
             if self.debug:
-                print("Load "+key)
-            result = self.results[key]
-            self.access_counter+=1 #Note: Python 3 has no integer overflow!
-            self.access_counters[key] = self.access_counter
-            return result.copy()
-        else:
-            if self.debug:
-                print("Load "+key+" - not found")
-            None
-
-    def store(self, schema: str, query: str, no_answer_strategy: str, result, verbose: bool):
-        if not self.has(schema,query,no_answer_strategy,False) and len(self.results.values()) == self.max_size:
-            sorted_keys = sorted(self.access_counters)
-            self.evict(sorted_keys[0])
-        
-        key = self.generate_key(schema,query,no_answer_strategy)
-        if self.debug:
-            print("Store "+key)    
-        self.results[key] = result.copy()
-        self.verbose_info[key] = verbose
-        self.access_counter+=1 #Note: Python 3 has no integer overflow!
-        self.access_counters[key] = self.access_counter
+                print("Store "+key)
+            entry["result"] = result.copy()
+            entry["verbose"] = verbose
 
-        id = str(uuid.uuid4())
-        self.keys_to_ids[key] = id
-        self.ids_to_keys[id] = key
-
-
-    def evict(self, schema: str, query: str, no_answer_strategy: str):
-        if self.has(schema,query,no_answer_strategy,False):
-            key = self.generate_key(schema,query,no_answer_strategy)
-            self.evict(key)
+    def touch(self, key: str):
+        # mark entry as most recently used
+        self.entries.move_to_end(key)
+        self.access_counter+=1 #Note: Python 3 has no integer overflow!
+        entry = self.entries[key]
+        entry["priority"] = self.access_counter
+        return entry
             
     def evict(self, key: str):
-        if self.debug:
-            print("Evict "+key)
-        del self.results[key]
-        del self.verbose_info[key]
-        del self.access_counters[key]
-        id = self.keys_to_ids[key]
-        del self.keys_to_ids[key]
-        del self.ids_to_keys[id]
-        
+        with self.lock:
+            if key in self.entries:
+                if self.debug:
+                    print("Evict "+key)
+                entry = self.entries.pop(key)
+                del self.ids_to_keys[entry["id"]]
+                self.evictions+=1
 
     def evict_all(self):
-        if self.debug:
-            print("Evict all")
-        self.access_counter = 0
-        self.results.clear()
-        self.verbose_info.clear()
-        self.access_counters.clear()
-        self.keys_to_ids.clear()
-        self.ids_to_keys.clear()
-
-    def generate_key(self, schema: str, query: str, no_answer_strategy: str):
-        return "{'schema':'"+schema+"', 'query':'"+query+"', 'no-answer-strategy':'"+no_answer_strategy+"'}"
-    
-
-
-    
-    
-
+        with self.lock:
+            if self.debug:
+                print("Evict all")
+            self.access_counter = 0
+            self.entries.clear()
+            self.ids_to_keys.clear()
+
+    def items(self):
+        """
+        Returns a list of all cached items (without their results) in order of their last access, i.e., the least recently used item first.
+        Each item is a dictionary with the fields 'id', 'key', 'description', 'priority', and 'isVerbose'.
+        """
+        with self.lock:
+            return [
+                {
+                    "id": entry["id"],
+                    "key": key,
+                    "description": entry["description"],
+                    "priority": entry["priority"],
+                    "isVerbose": entry["verbose"]
+                } for key, entry in self.entries.items()
+            ]
+
+    def get_item(self, id: str):
+        """
+        Returns the cached item with the passed ID including its result (field 'data') or 'None' if there is no item with this ID.
+        Reading an item does not change its position in the cache.
+        """
+        with self.lock:
+            if id not in self.ids_to_keys:
+                return None
+            key = self.ids_to_keys[id]
+            entry = self.entries[key]
+            return {
+                "id": id,
+                "key": key,
+                "description": entry["description"],
+                "priority": entry["priority"],
+                "isVerbose": entry["verbose"],
+                "data": entry["result"].copy()
+            }
+
+    def statistics(self):
+        """
+        Returns the number of cached items, the maximum size, and the hit, miss, and eviction counters as dictionary.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxSize": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRatio": self.hits/lookups if lookups else None
+            }
+
+    def generate_key(self, schema: str, query: str, no_answer_strategy: str, model: str = None):
+        """
+        Returns a fixed-size key (hex digest) for the passed schema, query, and no-answer strategy so that the memory used by the cache does not depend on the schema size.
+        If the cache is shared by multiple models, the model is part of the key (without a model, the key is the same as for a cache of a single model).
+        """
+        if model is None:
+            return hashlib.blake2b(json.dumps([schema,query,no_answer_strategy]).encode("utf-8"), digest_size=16).hexdigest()
+        return hashlib.blake2b(json.dumps([schema,query,no_answer_strategy,model]).encode("utf-8"), digest_size=16).hexdigest()
+
+    def describe_key(self, schema: str, query: str, no_answer_strategy: str, model: str = None):
+        """
+        Returns a compact, human-readable description of a key (with a truncated schema) that is only used for displaying cached items.
+        """
+        description = {
+            "schema": schema if len(schema) <= SCHEMA_PREVIEW_LENGTH else schema[:SCHEMA_PREVIEW_LENGTH]+"...",
+            "query": query,
+            "noAnswerStrategy": no_answer_strategy
+        }
+        if model is not None:
+            description["model"] = model
+        return description
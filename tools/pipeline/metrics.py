@@ -0,0 +1,199 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# buckets (upper bounds) of histograms measuring durations in seconds
+DURATION_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+# processing stages of a request in the order of their execution
+STAGES = ["cache", "prefilter", "tokenize", "predict", "interpret", "merge", "serialize"]
+# buckets (upper bounds) of histograms measuring numbers of tokenized samples (windows)
+SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096]
+
+def format_labels(label_names, label_values, extra = None):
+    labels = [name+'="'+str(value).replace("\\", "\\\\").replace('"', '\\"')+'"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    if labels:
+        return "{"+",".join(labels)+"}"
+    return ""
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    Monotonically increasing value (per combination of label values)
+    """
+
+    def __init__(self, name, description, label_names = ()) -> None:
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def inc(self, value = 1, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + value
+
+    def render(self):
+        lines = ["# HELP "+self.name+" "+self.description, "# TYPE "+self.name+" counter"]
+        with self.lock:
+            for label_values, value in self.values.items():
+                lines.append(self.name+format_labels(self.label_names, label_values)+" "+format_value(value))
+        return lines
+
+class Gauge:
+    """
+    Value that is read from the passed function whenever the metrics are rendered, e.g., the current length of a queue.
+    The function may return None if the value is not available.
+    """
+
+    def __init__(self, name, description, function) -> None:
+        self.name = name
+        self.description = description
+        self.function = function
+
+    def render(self):
+        value = self.function()
+        if value is None:
+            return []
+        return ["# HELP "+self.name+" "+self.description, "# TYPE "+self.name+" gauge", self.name+" "+format_value(value)]
+
+class Histogram:
+    """
+    Distribution of observed values (per combination of label values) over buckets with the passed upper bounds
+    """
+
+    def __init__(self, name, description, buckets, label_names = ()) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets)
+        self.label_names = label_names
+        # label values -> (counts per bucket plus '+Inf' bucket, sum of observed values)
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            if label_values not in self.values:
+                self.values[label_values] = [[0]*(len(self.buckets)+1), 0]
+            counts = self.values[label_values]
+            counts[0][i] += 1
+            counts[1] += value
+
+    def render(self):
+        lines = ["# HELP "+self.name+" "+self.description, "# TYPE "+self.name+" histogram"]
+        with self.lock:
+            for label_values, (counts, total) in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets+[float("inf")], counts):
+                    cumulative += count
+                    lines.append(self.name+"_bucket"+format_labels(self.label_names, label_values, 'le="'+format_value(bound)+'"')+" "+str(cumulative))
+                lines.append(self.name+"_sum"+format_labels(self.label_names, label_values)+" "+format_value(float(total)))
+                lines.append(self.name+"_count"+format_labels(self.label_names, label_values)+" "+str(cumulative))
+        return lines
+
+class Metrics:
+    """
+    Metrics of a pipeline (per process), which are rendered in the Prometheus text format.
+    """
+
+    def __init__(self, prefix = "restberta") -> None:
+        self.prefix = prefix
+        self.metrics = []
+        self.requests = self.add(Counter(prefix+"_requests_total", "Number of processed requests"))
+        self.queries = self.add(Counter(prefix+"_queries_total", "Number of processed queries by origin (model or cache)", ("origin",)))
+        self.stage_duration = self.add(Histogram(prefix+"_stage_duration_seconds", "Duration of the processing stages of a request", DURATION_BUCKETS, ("stage",)))
+        self.windows = self.add(Histogram(prefix+"_windows_per_request", "Number of tokenized samples (windows) fed into the model per request", SIZE_BUCKETS))
+        self.tokens = self.add(Counter(prefix+"_tokens_total", "Number of tokens fed into the model by kind (real tokens or padding tokens)", ("kind",)))
+        self.batch_size = self.add(Histogram(prefix+"_model_batch_size", "Number of tokenized samples per model call", SIZE_BUCKETS))
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    @contextmanager
+    def stage(self, name, timings = None):
+        """
+        Measures the duration of the enclosed code as duration of the stage with the passed name. If a dictionary of timings is passed,
+        the duration (in seconds) is added to the entry with the stage's name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.stage_duration.observe(duration, name)
+            if timings is not None:
+                timings[name] = timings.get(name, 0) + duration
+
+    def observe_tokenized_samples(self, tokenized_samples, timings = None):
+        """
+        Records the number of real and padding tokens fed into the model. If a dictionary of timings is passed, the number of tokenized samples (windows) is added to its entry 'windows'.
+        """
+        windows = len(tokenized_samples["input_ids"])
+        total_tokens = sum([len(input_ids) for input_ids in tokenized_samples["input_ids"]])
+        real_tokens = int(sum([sum(attention_mask) for attention_mask in tokenized_samples["attention_mask"]]))
+        self.tokens.inc(real_tokens, "real")
+        self.tokens.inc(total_tokens-real_tokens, "padding")
+        if timings is not None:
+            timings["windows"] = timings.get("windows", 0) + windows
+
+    def observe_request(self, timings):
+        """
+        Records a processed request based on its timings, i.e., the number of windows ('windows'), queries ('queries'), and queries loaded from cache ('cachedQueries').
+        """
+        self.requests.inc()
+        self.windows.observe(timings.get("windows", 0))
+        self.queries.inc(timings.get("queries", 0) - timings.get("cachedQueries", 0), "model")
+        self.queries.inc(timings.get("cachedQueries", 0), "cache")
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines)+"\n"
+
+def timings_to_dict(timings):
+    """
+    Converts the passed timings of a request (see Pipeline.process) into a dictionary with the stage durations in milliseconds and the counters of the request.
+    """
+    return {
+        "durations": {stage: round(timings[stage]*1000, 3) for stage in STAGES if stage in timings},
+        "windows": timings.get("windows", 0),
+        "queries": timings.get("queries", 0),
+        "cachedQueries": timings.get("cachedQueries", 0)
+    }
+
+def format_server_timing(timings, total = None):
+    """
+    Formats the passed timings of a request (see Pipeline.process) as value of a 'Server-Timing' header, e.g.,
+    'cache;dur=0.8, tokenize;dur=12.1, predict;dur=85.3, interpret;dur=9.4, merge;dur=1.2, serialize;dur=0.6, total;dur=109.4, windows;desc="12", cached;desc="3/9"'
+    """
+    metrics = [stage+";dur="+str(round(timings[stage]*1000, 3)) for stage in STAGES if stage in timings]
+    if total is not None:
+        metrics.append("total;dur="+str(round(total*1000, 3)))
+    metrics.append('windows;desc="'+str(timings.get("windows", 0))+'"')
+    metrics.append('cached;desc="'+str(timings.get("cachedQueries", 0))+"/"+str(timings.get("queries", 0))+'"')
+    return ", ".join(metrics)
@@ -0,0 +1,27 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+class QAModelOutput:
+    """
+    Output of a question answering model, i.e., the predicted start and end logits of each tokenized sample.
+    This class provides the same fields as the output of a Hugging Face question answering model so that it can be passed to the OutputInterpreter.
+    """
+
+    def __init__(self, start_logits, end_logits) -> None:
+        # start logits with shape (number of tokenized samples, padded length)
+        self.start_logits = start_logits
+        # end logits with shape (number of tokenized samples, padded length)
+        self.end_logits = end_logits
@@ -0,0 +1,217 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from .pipeline import Pipeline
+from .input_tokenizer import InputTokenizer
+from .schema_cache import SchemaCache
+from .batch_scheduler import BatchScheduler
+from .metrics import Metrics, Gauge
+
+import threading
+from collections import OrderedDict
+
+class UnknownModelException(Exception):
+    def __init__(self, message="Unknown model") -> None:
+        self.message = message
+        super().__init__(self.message)
+
+class ModelRegistry:
+    """
+    Hosts the pipelines of multiple models (checkpoints) in one process. The pipelines are created on first use and share one tokenizer (including its schema cache),
+    the result cache (in which the results are stored per model), and the metrics. If a memory budget is set, the least recently used models are evicted
+    as soon as the weights of the loaded models exceed the budget.
+    """
+
+    def __init__(self, models: dict, default_model = None, memory_budget = None, cache = None, warm_up = False, tokenizer_checkpoint = "microsoft/codebert-base", padding = "max_length", padding_buckets = None, schema_cache_size = 100, pipeline_args = None, model_args = None) -> None:
+        """
+        Parameters
+        ----------
+        models : dict
+            Checkpoint of each model by its alias, e.g., {'pm': 'SebastianKotstein/restberta-qa-parameter-matching'}
+        default_model : str
+            Alias of the model that is used if no model is requested explicitly (default: the first model)
+        memory_budget : int
+            Maximum number of bytes occupied by the weights of the loaded models (None: unlimited)
+        cache :
+            Result cache (LRUCache or SQLiteCache) shared by all models
+        warm_up : bool
+            If set, a model that is loaded on first use is warmed up (see Pipeline.warm_up) before it serves the request
+        tokenizer_checkpoint : str
+            Checkpoint of the tokenizer shared by all models
+        padding, padding_buckets, schema_cache_size :
+            Settings of the shared tokenizer (see Pipeline)
+        pipeline_args : dict
+            Further arguments of the pipelines (see Pipeline), e.g., 'best_size' or 'backend'
+        model_args : dict
+            Arguments of the pipeline of a specific model by its alias, e.g., its 'onnx_path'
+        """
+        if not models:
+            raise ValueError("At least one model must be registered.")
+        if default_model is not None and default_model not in models:
+            raise ValueError("The default model '"+str(default_model)+"' is not registered.")
+        self.checkpoints = dict(models)
+        self.default_model = default_model if default_model is not None else next(iter(models))
+        self.memory_budget = memory_budget
+        self.cache = cache
+        self.warm_up = warm_up
+        self.tokenizer_checkpoint = tokenizer_checkpoint
+        self.pipeline_args = pipeline_args or dict()
+        self.model_args = model_args or dict()
+
+        self.schema_cache = SchemaCache(schema_cache_size) if schema_cache_size else None
+        self.tokenizer = InputTokenizer(tokenizer_checkpoint, padding = padding, padding_buckets = padding_buckets, schema_cache = self.schema_cache)
+
+        # loaded pipelines in order of their last use (least recently used pipeline first)
+        self.pipelines = OrderedDict()
+        # number of bytes occupied by the weights of each model that has been loaded at least once
+        self.memory_sizes = dict()
+        self.lock = threading.Lock()
+        # one lock per model so that a model is loaded only once, while the other models keep serving requests
+        self.loading_locks = {alias: threading.Lock() for alias in self.checkpoints}
+
+        self.metrics = Metrics()
+        if cache:
+            self.metrics.add(Gauge(self.metrics.prefix+"_cache_hit_ratio", "Ratio of cache lookups that returned a cached result", lambda: self.cache.statistics()["hitRatio"]))
+            self.metrics.add(Gauge(self.metrics.prefix+"_cache_size", "Number of cached results", lambda: self.cache.statistics()["size"]))
+        if self.pipeline_args.get("max_batch_wait"):
+            self.metrics.add(Gauge(self.metrics.prefix+"_scheduler_queue_depth", "Number of requests waiting for a shared model batch", self.queue_depth))
+        self.metrics.add(Gauge(self.metrics.prefix+"_loaded_models", "Number of loaded models", lambda: len(self.pipelines)))
+        self.metrics.add(Gauge(self.metrics.prefix+"_model_memory_bytes", "Number of bytes occupied by the weights of the loaded models", self.memory_usage))
+
+    def get(self, alias = None):
+        """
+        Returns the pipeline of the model with the passed alias (default model if None). The model is loaded if it is not loaded yet.
+        Raises an UnknownModelException if no model with this alias is registered.
+        """
+        if alias is None:
+            alias = self.default_model
+        if alias not in self.checkpoints:
+            raise UnknownModelException("The model '"+str(alias)+"' does not exist. Available models are "+", ".join(["'"+alias+"'" for alias in self.checkpoints])+".")
+        return self.load(alias, self.warm_up)
+
+    def load(self, alias, warm_up = None):
+        """
+        Returns the pipeline of the model with the passed alias and loads the model if it is not loaded yet, evicting the least recently used models if the memory budget is exceeded.
+        If 'warm_up' is True, a newly loaded model is warmed up, if it is False, the model is marked as ready right away. If it is None, the caller is responsible for
+        warming up the model or marking it as ready (e.g. in a background thread of a forked worker process).
+        """
+        with self.lock:
+            if alias in self.pipelines:
+                self.pipelines.move_to_end(alias)
+                return self.pipelines[alias]
+
+        with self.loading_locks[alias]:
+            with self.lock:
+                # the model may have been loaded by a concurrent request in the meantime
+                if alias in self.pipelines:
+                    self.pipelines.move_to_end(alias)
+                    return self.pipelines[alias]
+                # make room for the model before loading it, based on its size when it was loaded before (or the size of the largest known model)
+                self.evict_least_recently_used(self.memory_sizes.get(alias, max(self.memory_sizes.values(), default=0)))
+
+            print("Load model '"+alias+"': "+self.checkpoints[alias])
+            pipeline = Pipeline(
+                self.checkpoints[alias],
+                cache = self.cache,
+                tokenizer_checkpoint = self.tokenizer_checkpoint,
+                tokenizer = self.tokenizer,
+                metrics = self.metrics,
+                # results are cached per model only if the cache is shared by multiple models (a single model keeps the keys of a dedicated cache)
+                cache_namespace = self.checkpoints[alias] if len(self.checkpoints) > 1 else None,
+                **self.pipeline_args,
+                **self.model_args.get(alias, dict())
+            )
+            if warm_up:
+                pipeline.warm_up()
+            elif warm_up is not None:
+                pipeline.ready.set()
+
+            with self.lock:
+                self.memory_sizes[alias] = pipeline.memory_size()
+                self.evict_least_recently_used(self.memory_sizes[alias])
+                self.pipelines[alias] = pipeline
+            return pipeline
+
+    def evict_least_recently_used(self, required_size):
+        """
+        Evicts the least recently used models until the passed number of bytes fits into the memory budget (the lock must be held by the caller).
+        """
+        if not self.memory_budget:
+            return
+        while self.pipelines and self.memory_usage() + required_size > self.memory_budget:
+            alias, pipeline = self.pipelines.popitem(last=False)
+            print("Evict model '"+alias+"'")
+            # requests that are still processed by the pipeline are completed, the model is released as soon as they have finished
+            pipeline.close()
+
+    def evict(self, alias):
+        """
+        Evicts the model with the passed alias. Returns True if the model was loaded, False otherwise.
+        """
+        with self.lock:
+            pipeline = self.pipelines.pop(alias, None)
+        if pipeline is None:
+            return False
+        pipeline.close()
+        return True
+
+    def is_ready(self, alias = None):
+        """
+        Returns whether the model with the passed alias (default model if None) is ready to serve requests, without loading it:
+        a loaded model is ready as soon as it has been warmed up, an evicted model is considered ready since it is reloaded on demand.
+        """
+        if alias is None:
+            alias = self.default_model
+        with self.lock:
+            pipeline = self.pipelines.get(alias)
+            if pipeline is not None:
+                return pipeline.ready.is_set()
+            # models that have been loaded before (i.e., evicted in the meantime) have a known memory size
+            return alias in self.memory_sizes
+
+    def memory_usage(self):
+        """
+        Returns the number of bytes occupied by the weights of the loaded models
+        """
+        return sum([self.memory_sizes[alias] for alias in list(self.pipelines.keys())])
+
+    def queue_depth(self):
+        """
+        Returns the number of requests waiting for a shared model batch over all loaded models
+        """
+        return sum([pipeline.model.queue_depth() for pipeline in list(self.pipelines.values()) if isinstance(pipeline.model, BatchScheduler)])
+
+    def post_fork(self, intra_op_threads = None):
+        """
+        Prepares the loaded pipelines for serving requests in a forked worker process (see Pipeline.post_fork)
+        """
+        for pipeline in list(self.pipelines.values()):
+            pipeline.post_fork(intra_op_threads)
+
+    def describe(self):
+        """
+        Returns the alias, checkpoint, and state of each registered model
+        """
+        with self.lock:
+            return [
+                {
+                    "alias": alias,
+                    "checkpoint": checkpoint,
+                    "isDefault": alias == self.default_model,
+                    "isLoaded": alias in self.pipelines,
+                    "memorySize": self.memory_sizes.get(alias)
+                } for alias, checkpoint in self.checkpoints.items()
+            ]
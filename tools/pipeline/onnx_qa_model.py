@@ -0,0 +1,267 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from .model_output import QAModelOutput
+
+import os
+
+import numpy as np
+import onnxruntime as ort
+
+# initializers smaller than this size (in bytes) remain part of the serialized model
+SHARED_INITIALIZER_MIN_SIZE = 1024
+
+def export_onnx_model(checkpoint, path, token = None, tokenizer_checkpoint = "microsoft/codebert-base"):
+    """
+    Exports the passed (TensorFlow) question answering checkpoint into an ONNX model and stores it at the passed path.
+    The export requires TensorFlow and tf2onnx, which are not required for serving the exported model.
+
+    Parameters
+    ----------
+    checkpoint : str
+        Name of the checkpoint on Hugging Face or path to a local checkpoint
+    path : str
+        Path of the ONNX model file
+    token : str
+        Optional Hugging Face access token
+    tokenizer_checkpoint : str
+        Name or path of the tokenizer used for creating the dummy inputs of the export
+    """
+    from pathlib import Path
+    from transformers import AutoTokenizer, TFAutoModelForQuestionAnswering
+    from transformers.onnx import FeaturesManager, export
+
+    if token:
+        model = TFAutoModelForQuestionAnswering.from_pretrained(checkpoint, token = token)
+    else:
+        model = TFAutoModelForQuestionAnswering.from_pretrained(checkpoint)
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_checkpoint)
+
+    _, onnx_config_constructor = FeaturesManager.check_supported_model_or_raise(model, feature="question-answering")
+    onnx_config = onnx_config_constructor(model.config)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    export(tokenizer, model, onnx_config, onnx_config.default_onnx_opset, Path(path))
+
+def quantize_onnx_model(path, quantized_path, quantize = "int8"):
+    """
+    Quantizes the weights of the passed ONNX model dynamically (i.e., activations are quantized at runtime) and stores the quantized model at 'quantized_path'.
+
+    Parameters
+    ----------
+    path : str
+        Path of the (fp32) ONNX model file
+    quantized_path : str
+        Path of the quantized ONNX model file
+    quantize : str
+        Weight type, currently only 'int8' is supported
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    if quantize != "int8":
+        raise ValueError("Invalid quantization '"+str(quantize)+"'. Allowed value is 'int8'.")
+    quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+
+def get_quantized_path(path, quantize):
+    """
+    Returns the path of the quantized model that belongs to the passed (fp32) ONNX model path, e.g. 'model.int8.onnx' for 'model.onnx'.
+    """
+    root, extension = os.path.splitext(path)
+    return root+"."+quantize+(extension or ".onnx")
+
+def get_optimized_path(path):
+    """
+    Returns the path of the optimized model that belongs to the passed ONNX model path, e.g. 'model.opt.onnx' for 'model.onnx'.
+    """
+    root, extension = os.path.splitext(path)
+    return root+".opt"+(extension or ".onnx")
+
+def optimize_onnx_model(path, optimized_path):
+    """
+    Applies the graph optimizations (e.g. the fusion of the attention layers) to the passed ONNX model offline and stores the optimized model at 'optimized_path'.
+    The weights of the optimized model are stored in a separate file next to it ('optimized_path' + '.data').
+    Fusions that are applied while creating a session may create new (e.g. concatenated) weights, which would be private to each worker process instead of shared.
+
+    Parameters
+    ----------
+    path : str
+        Path of the ONNX model file
+    optimized_path : str
+        Path of the optimized ONNX model file
+    """
+    options = ort.SessionOptions()
+    # extended instead of all optimizations, since the layout optimizations of the latter are specific to the hardware
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = optimized_path
+    options.add_session_config_entry("session.optimized_model_external_initializers_file_name", os.path.basename(optimized_path)+".data")
+    options.add_session_config_entry("session.optimized_model_external_initializers_min_size_in_bytes", str(SHARED_INITIALIZER_MIN_SIZE))
+    ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+def release_free_memory():
+    """
+    Returns freed heap memory to the operating system (glibc only), e.g. the weights that ONNX Runtime has read from the model file before they are replaced by the shared arrays
+    """
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def load_shared_initializers(path):
+    """
+    Loads the (large) initializers, i.e., the weights, of the passed ONNX model into numpy arrays that are passed to ONNX Runtime via 'SessionOptions.add_initializer'.
+    ONNX Runtime does not copy these arrays (as long as prepacking is disabled, see ONNXQAModel.create_session), so that sessions created in forked worker processes share them copy-on-write.
+
+    Parameters
+    ----------
+    path : str
+        Path of the ONNX model file
+
+    Returns
+    -------
+    A dictionary mapping the names of the initializers to their arrays
+    """
+    import onnx
+    from onnx import numpy_helper
+
+    model = onnx.load(path)
+    initializers = dict()
+    for initializer in model.graph.initializer:
+        array = numpy_helper.to_array(initializer)
+        if array.nbytes < SHARED_INITIALIZER_MIN_SIZE:
+            continue
+        # copy the weights out of the model, which is released afterwards
+        initializers[initializer.name] = np.array(array, order="C")
+    return initializers
+
+class ONNXQAModel:
+    """
+    Question answering model that is served by ONNX Runtime. The model provides the same 'predict' method as the (TensorFlow) QAModel.
+    If the ONNX model file does not exist, the passed checkpoint is exported once and stored at the passed path.
+    If 'quantize' is set to 'int8', the model with int8 weights (stored next to the fp32 model) is served instead, which is created once from the fp32 model if it does not exist.
+    If 'share_weights' is set, the model is optimized offline once (stored next to the served model, see 'optimize_onnx_model'), only its weights are loaded by the constructor (in the master process),
+    and the session is created by 'post_fork()' in each worker process, so that the workers share the weights copy-on-write instead of loading their own copy.
+    """
+
+    def __init__(self, checkpoint, path, batch_size = None, token = None, intra_op_threads = None, quantize = None, share_weights = False, tokenizer_checkpoint = "microsoft/codebert-base") -> None:
+        if quantize:
+            quantized_path = get_quantized_path(path, quantize)
+            if not os.path.exists(quantized_path):
+                if not os.path.exists(path):
+                    print("Export "+checkpoint+" to "+path)
+                    export_onnx_model(checkpoint, path, token, tokenizer_checkpoint)
+                print("Quantize "+path+" to "+quantized_path)
+                quantize_onnx_model(path, quantized_path, quantize)
+            path = quantized_path
+        elif not os.path.exists(path):
+            print("Export "+checkpoint+" to "+path)
+            export_onnx_model(checkpoint, path, token, tokenizer_checkpoint)
+        self.path = path
+        self.batch_size = batch_size
+        self.intra_op_threads = intra_op_threads
+        self.session = None
+
+        if share_weights:
+            optimized_path = get_optimized_path(path)
+            # the optimized model is created again if the model has been replaced (e.g. exported again) in the meantime
+            if not os.path.exists(optimized_path) or os.path.getmtime(optimized_path) < os.path.getmtime(path):
+                print("Optimize "+path+" to "+optimized_path)
+                optimize_onnx_model(path, optimized_path)
+            self.path = optimized_path
+            # the session is created after forking (see post_fork), the weights are loaded once and shared copy-on-write by all worker processes
+            self.initializers = load_shared_initializers(optimized_path)
+        else:
+            self.initializers = None
+            self.create_session()
+
+    def create_session(self):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        if self.initializers:
+            # the model has been optimized offline, optimizations applied here could copy the shared weights
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            # the passed arrays override the initializers of the model file and are used without copying them, i.e., they must stay alive as long as the session
+            # (unlike 'add_external_initializers', which copies the data into the session)
+            self.initializer_values = {name: ort.OrtValue.ortvalue_from_numpy(array) for name, array in self.initializers.items()}
+            for name, value in self.initializer_values.items():
+                options.add_initializer(name, value)
+            # ONNX Runtime would otherwise create a private, prepacked copy of every MatMul weight in each session, i.e., in each worker process.
+            # Without prepacking, the MatMul kernels pack the weights on every run, which is slower (see README).
+            options.add_session_config_entry("session.disable_prepacking", "1")
+        self.session = ort.InferenceSession(self.path, sess_options=options, providers=["CPUExecutionProvider"])
+        if self.initializers:
+            release_free_memory()
+
+        # the exported model may either expect int32 or int64 inputs
+        self.input_types = {
+            model_input.name: np.int32 if model_input.type == "tensor(int32)" else np.int64 for model_input in self.session.get_inputs()
+        }
+
+    def post_fork(self, intra_op_threads = None):
+        """
+        Creates the session in a (forked) worker process, optionally with the passed number of intra-op threads of this worker.
+        """
+        if intra_op_threads:
+            self.intra_op_threads = intra_op_threads
+        if self.session is None:
+            self.create_session()
+
+    def memory_size(self):
+        if self.initializers:
+            return sum([initializer.nbytes for initializer in self.initializers.values()])
+        return os.path.getsize(self.path)
+
+    def close(self):
+        # the session is released as soon as it is no longer referenced
+        pass
+
+    def predict(self, batched_samples):
+        """
+        Converts the passed batch of tokenized samples into arrays that are feed into the ONNX model for prediction.
+        If a batch size has been specified, the model processes the tokenized samples in micro-batches of this size.
+        The method returns the model's output as well as the number of input samples.
+        
+        Parameters
+        ----------
+        batched_samples : [dict()]
+            Batch of samples where each sample is a dictionary have the fields 'attention_mask' and 'input_ids'
+            
+        Returns
+        -------
+        The output of the model (first return parameter) and the number of input samples (second return parameter)
+        """
+        if self.session is None:
+            # the model is used without forking
+            self.create_session()
+        batch = {
+            name: np.asarray(batched_samples[name], dtype=dtype) for name, dtype in self.input_types.items()
+        }
+        batch_counter = batch["input_ids"].shape[0]
+        batch_size = self.batch_size or batch_counter
+
+        start_logits = []
+        end_logits = []
+        for offset in range(0, batch_counter, batch_size):
+            micro_batch = {name: values[offset:offset+batch_size] for name, values in batch.items()}
+            micro_batch_start_logits, micro_batch_end_logits = self.session.run(["start_logits", "end_logits"], micro_batch)
+            start_logits.append(micro_batch_start_logits)
+            end_logits.append(micro_batch_end_logits)
+
+        return QAModelOutput(np.concatenate(start_logits), np.concatenate(end_logits)), batch_counter
@@ -14,20 +14,30 @@ Copyright 2023 Sebastian Kotstein
    limitations under the License.
 '''
 
+from .property_index import PropertyIndex
+
 import numpy as np
 
 class OutputInterpreter:
     
-    def __init__(self, best_size: int) -> None:
+    def __init__(self, best_size: int, schema_cache = None) -> None:
         self.n_best_size = best_size
+        # optional SchemaCache for storing the PropertyIndex of each paragraph
+        self.schema_cache = schema_cache
     
     def interpret_output(self, tokenized_samples, model_output, batch_size, no_answer_strategy = None):
         
         results = self.create_empty_results_dict()
+        # property index per paragraph (all tokenized samples of a paragraph share the same index)
+        property_indices = dict()
+        # index of the result entry per QA sample, identified by (paragraph ID, sample ID) since the same sample ID may be used for multiple paragraphs
+        result_indices = dict()
 
         for i in range(batch_size):
+            key = (tokenized_samples["qa_sample_paragraph_id"][i], tokenized_samples["qa_sample_id"][i])
             # create and append result entry to the list of results
-            if tokenized_samples["qa_sample_id"][i] not in results["qa_sample_id"]:
+            if key not in result_indices:
+                result_indices[key] = len(results["qa_sample_id"])
                 
                 # append ID of the QA sample to the list of results
                 results["qa_sample_id"].append(tokenized_samples["qa_sample_id"][i])
@@ -47,7 +57,7 @@ class OutputInterpreter:
                 results["tokenized_samples"].append([])
 
             # query index of result entry 
-            index = list(results["qa_sample_id"]).index(tokenized_samples["qa_sample_id"][i])    
+            index = result_indices[key]
 
             # prepare tokenized sample object
             tokenized_sample = {
@@ -56,13 +66,19 @@ class OutputInterpreter:
                 "fragment_tokens": tokenized_samples["tokenized_sample_fragment_tokens"][i]
             }
 
+            paragraph = tokenized_samples["qa_sample_paragraph"][i]
+            if paragraph not in property_indices:
+                cacheable = tokenized_samples.get("qa_sample_paragraph_cacheable")
+                property_indices[paragraph] = self.get_property_index(paragraph, cacheable is None or cacheable[i])
+
             # interpret prediction
             answers = self.get_answers(
                 offset_mapping=tokenized_samples["offset_mapping"][i],
                 cls_index=tokenized_samples["tokenized_sample_cls_index"][i],
                 paragraph=tokenized_samples["qa_sample_paragraph"][i],
                 predicted_start_logits=model_output.start_logits[i],
-                predicted_end_logits=model_output.start_logits[i]
+                predicted_end_logits=model_output.start_logits[i],
+                property_index=property_indices[paragraph]
                 #suppress_duplicates=suppress_duplicates
             )
             tokenized_sample["answers"] = answers
@@ -77,35 +93,28 @@ class OutputInterpreter:
     
     def combine_answers(self, results, no_answer_strategy = None):
         for i in range(len(results["qa_sample_id"])):
-            #prepare list of combined answers, i.e., answers over all tokenized samples
-            combined_answers = []
-            # iterate over all tokenized samples of QA sample
-            for tokenized_sample in results["tokenized_samples"][i]:
-
-                # apply default 'no-answer-strategy': Add all answers except the NULL answer
-                if no_answer_strategy is None or no_answer_strategy == "ignore":
-                    # iterate over all answers of tokenized sample
-                    for answer in tokenized_sample["answers"]:
-                        # append answer of tokenized sample if it is NOT an out of span answer
-                        if answer["property"] is not None:
-                            combined_answers.append(answer.copy())
-
-                # apply 'treshold no-answer-strategy': Add all answers that have a higher score than the NULL answer
-                elif no_answer_strategy == "treshold":
-                    null_answer_score = None
-                    # find NULL answer
-                    for answer in tokenized_sample["answers"]:
-                        if answer["property"] is None:
-                            null_answer_score = float(answer["score"])
-                    # iterave over all answers of tokenized sample
-                    for answer in tokenized_sample["answers"]:
-                        # check whether the answer's score is higher than the score of the NULL answer (and it is not the NULL answer itself)
-                        if float(answer["score"])>=null_answer_score and answer["property"] is not None:
-                            combined_answers.append(answer.copy())
-            
-            # sort list of combined answers
-            combined_answers = sorted(combined_answers, key=lambda x: float(x["score"]), reverse=True)
-            results["answers"].append(combined_answers)  
+            # answers of all tokenized samples of QA sample (each tokenized sample has exactly one NULL answer)
+            tokenized_sample_answers = [tokenized_sample["answers"] for tokenized_sample in results["tokenized_samples"][i]]
+            answers = [answer for sample_answers in tokenized_sample_answers for answer in sample_answers]
+            scores = np.fromiter((answer["score"] for answer in answers), dtype=np.float64, count=len(answers))
+            is_null_answer = np.fromiter((answer["property"] is None for answer in answers), dtype=bool, count=len(answers))
+
+            # apply default 'no-answer-strategy': Add all answers except the NULL answer
+            is_combined = ~is_null_answer
+            # apply 'treshold no-answer-strategy': Add all answers that have a higher score than the NULL answer of their tokenized sample
+            if no_answer_strategy == "treshold":
+                tokenized_sample_indices = np.repeat(np.arange(len(tokenized_sample_answers)), [len(sample_answers) for sample_answers in tokenized_sample_answers])
+                null_answer_scores = np.full(len(tokenized_sample_answers), -np.inf)
+                null_answer_scores[tokenized_sample_indices[is_null_answer]] = scores[is_null_answer]
+                is_combined &= scores >= null_answer_scores[tokenized_sample_indices]
+            elif no_answer_strategy is not None and no_answer_strategy != "ignore":
+                is_combined[:] = False
+
+            # sort combined answers by score in descending order (answers with equal scores keep their order)
+            # the answers are shared with the tokenized samples, they are copied when the results are post-processed (see post_processing.py)
+            combined_indices = np.flatnonzero(is_combined)
+            combined_indices = combined_indices[np.argsort(-scores[combined_indices], kind="stable")]
+            results["answers"].append([answers[k] for k in combined_indices])
         return results   
 
     
@@ -161,80 +170,16 @@ class OutputInterpreter:
         -------
         List of identified properties
         """
-        properties = []
-        current_property = None
-        is_on_property = False
-
-        # iterate over each character of the span
-        for i in range(end_char_index-start_char_index):
-            index = start_char_index+i
-            c = context[index]
-            
-            # if character is a property separator
-            if c == " ":
-                # if there is still an unfinished property
-                if is_on_property:
-                    # finalize property
-                    current_property["end_char_index"] = index
-                    
-                    # if start index of property is start index of whole span (answer), i.e. there are characters belonging to the property that are before span
-                    if current_property["start_char_index"] == start_char_index:
-                        # go backward in context and determine full property name
-                        back_counter = start_char_index-1
-                        while back_counter >= 0 and context[back_counter] != " ":
-                            current_property["name"] = context[back_counter] + current_property["name"]
-                            current_property["partial"] = True # only True (i.e partial), if we have to go backward
-                            back_counter-=1
-                    properties.append(current_property)
-                    current_property = None
-                is_on_property = False
-            else:
-                # if this is the first character of a new property
-                if not is_on_property:
-                    # prepare a new property
-                    current_property = {
-                        "name": c,
-                        "partial_name": c,
-                        "length": 1,
-                        "partial": False,
-                        "start_char_index": index,
-                        "end_char_index": None
-                    }
-                else:
-                    # else, append character to current property
-                    current_property["name"]+= c
-                    current_property["partial_name"]+= c
-                    current_property["length"]+=1
-                
-                # in both cases (either a new or an existing one), we are on a property 
-                is_on_property = True
+        return self.get_property_index(context).identify_properties(start_char_index,end_char_index)
 
-        # after iterating over all characters of span
-        # check whether there is an unfinished property:
-        if current_property:
-            current_property["end_char_index"] = end_char_index
-            
-            # go forward in context and determine full property name
-            forward_counter = end_char_index
-            while forward_counter < len(context) and context[forward_counter] != " ":
-                current_property["name"] = current_property["name"] + context[forward_counter]
-                current_property["partial"] = True # only True (i.e partial), if we have to go forward
-                forward_counter+=1
-                
-            
-            # Special case: If the unfinished property is the only identified property (i.e. properties is empty),
-            # we had not the chance to go backward yet (since going backward is only possible, when finalizing a property, see code above)
-            # Thus go backward in context and determine full property name
-            if len(properties) == 0:
-                back_counter = start_char_index-1
-                while back_counter >= 0 and context[back_counter] != " ":
-                    current_property["name"] = context[back_counter] + current_property["name"]
-                    current_property["partial"] = True # only True (i.e partial), if we have to go backward
-                    back_counter-=1
-                    
-            properties.append(current_property)
-            
-        return properties
+    def get_property_index(self, context, cacheable = True):
+        """
+        Returns the PropertyIndex of the passed context. If a schema cache has been set (and the context is cacheable), the index is built only once per context and stored in the schema cache.
+        """
+        if self.schema_cache is not None and cacheable:
+            return self.schema_cache.get(context, "property_index", lambda: PropertyIndex(context))
+        else:
+            return PropertyIndex(context)
 
     def determine_best_property(self,properties):
         """
@@ -354,73 +299,100 @@ class OutputInterpreter:
             return False
     
 
-    def get_answers(self, offset_mapping, cls_index, paragraph, predicted_start_logits, predicted_end_logits):
+    def get_best_indices(self, logits):
+        """
+        Returns the indices of the 'n_best_size' highest logits sorted by logit in descending order.
+        Instead of sorting all logits, the method only sorts the top-k logits determined by partitioning.
         
-        # Gather the indices for the best start/end logits (index syntax is: [stop:start:steps] with steps = -1 --> negative order)
-        # np.argsort returns a sorted list of indices in ascending order, therefore, we gather the last 'n_best_size' indices
-        # in reverse order (syntax: [stop:start:steps] with steps = -1 --> negative order)
-        #(see https://towardsdatascience.com/the-basics-of-indexing-and-slicing-python-lists-2d12c90a94cf)
-        best_start_indices = np.argsort(predicted_start_logits)[-1 : -self.n_best_size - 1 : -1].tolist()
-        best_end_indices = np.argsort(predicted_end_logits)[-1 : -self.n_best_size - 1 : -1].tolist()   
+        Parameters
+        ----------
+        logits : np.ndarray
+            Vector of start or end logits
+            
+        Returns
+        -------
+        Vector of indices
+        """
+        if self.n_best_size >= len(logits):
+            return np.argsort(-logits, kind="stable")
+        best_indices = np.argpartition(-logits, self.n_best_size - 1)[:self.n_best_size]
+        return best_indices[np.argsort(-logits[best_indices], kind="stable")]
+
+    def get_answers(self, offset_mapping, cls_index, paragraph, predicted_start_logits, predicted_end_logits, property_index = None):
         
-        # prepare list for answers
-        valid_answers = []
+        if property_index is None:
+            property_index = self.get_property_index(paragraph)
+
+        predicted_start_logits = np.asarray(predicted_start_logits)
+        predicted_end_logits = np.asarray(predicted_end_logits)
+
+        # Gather the indices for the best start/end logits (in descending order)
+        best_start_indices = self.get_best_indices(predicted_start_logits)
+        best_end_indices = self.get_best_indices(predicted_end_logits)
         
-        for start_index in best_start_indices:
-            for end_index in best_end_indices:
-                # Do not consider....
-                
-                # Case 1:) Answers that are out of context
-                # In this case, either start_index or end_index (or both) point to a token positions outside the context
-                # Remember: We have set all positions of tokens, which are out of context, with 'None' in "offset_mapping" (see tokenize_validation_samples)
-                if self.are_indices_out_of_context(start_index,end_index,offset_mapping):
-                    continue
-                    
-                # Case 2:) Answers where end is before start index
-                if self.is_end_before_start(start_index, end_index):
-                    continue
-                
-                # Optional case 3:) Answers that are too long
-                #if self.is_answer_too_long(start_index, end_index,self.max_answer_length):
-                #    continue
-                
-                
-                start_char_index = offset_mapping[start_index][0]
-                end_char_index = offset_mapping[end_index][1]
-                
-                # identify properties and determine best property
-                properties = self.identify_properties(paragraph,start_char_index,end_char_index)
-                best_property = self.determine_best_property(properties)
-                
-                # Case 4:) Answers that do not point clearly to a property (without conflicts)
-                if best_property is None:
-                    continue
-                
-                # add answer:
-                valid_answers.append(
+        # Mark all tokens that are part of the context
+        # Remember: We have set all positions of tokens, which are out of context, with 'None' in "offset_mapping" (see tokenize_validation_samples)
+        # (tokens beyond the offset mapping are treated as out of context, should never happen)
+        is_in_context = np.zeros(max(len(offset_mapping), len(predicted_start_logits), len(predicted_end_logits)), dtype=bool)
+        is_in_context[:len(offset_mapping)] = [o is not None for o in offset_mapping]
+
+        # Evaluate all pairs of start and end indices at once (rows: start indices, columns: end indices). Do not consider....
+        # Case 1:) Answers that are out of context
+        # In this case, either start_index or end_index (or both) point to a token positions outside the context
+        is_valid = is_in_context[best_start_indices][:, None] & is_in_context[best_end_indices][None, :]
+        # Case 2:) Answers where end is before start index
+        is_valid &= best_end_indices[None, :] >= best_start_indices[:, None]
+        # Optional case 3:) Answers that are too long
+        #is_valid &= best_end_indices[None, :] - best_start_indices[:, None] + 1 <= self.max_answer_length
+
+        scores = predicted_start_logits[best_start_indices][:, None] + predicted_end_logits[best_end_indices][None, :]
+        
+        # character offsets of the remaining pairs (in the same order as iterating over start and end indices)
+        valid_start_indices, valid_end_indices = np.nonzero(is_valid)
+        start_char_offsets = np.asarray([offset_mapping[k][0] if is_in_context[k] else -1 for k in best_start_indices], dtype=np.int64)
+        end_char_offsets = np.asarray([offset_mapping[k][1] if is_in_context[k] else -1 for k in best_end_indices], dtype=np.int64)
+        start_char_indices = start_char_offsets[valid_start_indices]
+        end_char_indices = end_char_offsets[valid_end_indices]
+
+        # determine the best property of all remaining pairs at once
+        best_properties = property_index.determine_best_properties(start_char_indices, end_char_indices)
+        # Case 4:) Answers that do not point clearly to a property (without conflicts)
+        has_best_property = best_properties >= 0
+
+        # finally, add NULL answer as valid answer
+        valid_scores = np.append(scores[valid_start_indices, valid_end_indices][has_best_property], predicted_start_logits[cls_index] + predicted_end_logits[cls_index]).astype(np.float64)
+        start_char_indices = start_char_indices[has_best_property]
+        end_char_indices = end_char_indices[has_best_property]
+        best_properties = best_properties[has_best_property]
+        
+        # sort valid answers by score in descending order (answers with equal scores keep their order), the dictionaries of the answers are created only at the end
+        # scores are kept as (Python) floats, they are formatted when the results are serialized (see result_format.py)
+        sorted_valid_answer = []
+        for k in np.argsort(-valid_scores, kind="stable"):
+            if k == len(best_properties):
+                # NULL answer
+                sorted_valid_answer.append(
+                    {
+                        "score": float(valid_scores[k]),
+                        "span": None,
+                        "start_char_index": cls_index,
+                        "end_char_index": cls_index,
+                        "property": None
+                    }
+                )
+            else:
+                start_char_index = int(start_char_indices[k])
+                end_char_index = int(end_char_indices[k])
+                sorted_valid_answer.append(
                     {
-                        "score": predicted_start_logits[start_index] + predicted_end_logits[end_index],
+                        "score": float(valid_scores[k]),
                         "span": paragraph[start_char_index:end_char_index],
                         "start_char_index": start_char_index,
                         "end_char_index": end_char_index,
-                        "property": best_property
+                        "property": property_index.create_property(int(best_properties[k]), start_char_index, end_char_index)
                     }
                 )
         
-        # finally, add NULL answer as valid answer
-        valid_answers.append(
-            {
-                "score": predicted_start_logits[cls_index] + predicted_end_logits[cls_index],
-                "span": None,
-                "start_char_index": cls_index,
-                "end_char_index": cls_index,
-                "property": None
-            }
-        )
-        
-        # sort valid answers by score in descending order
-        sorted_valid_answer = sorted(valid_answers, key=lambda x: x["score"], reverse=True)
-        
         # sourced out to pipeline.py as we want to suppress duplicates in both the aggregated answer set and the set per tokenized sample
         #if suppress_duplicates:
         #    without_duplicates = {}
@@ -435,12 +407,6 @@ class OutputInterpreter:
         #            
         #    sorted_valid_answer = [x for x in without_duplicates.values()]
 
-        #scores = np.array([answer["score"] for answer in sorted_valid_answer])
-        #softmax = np.exp(scores)/sum(np.exp(scores))
-        
-        for i in range(len(sorted_valid_answer)):
-            sorted_valid_answer[i]["score"] = str(sorted_valid_answer[i]["score"])
-        #    sorted_valid_answer[i]["probability"] = str(softmax[i])
-
+        # probabilities are calculated when the results are post-processed (see post_processing.py)
             
         return sorted_valid_answer
\ No newline at end of file
@@ -16,13 +16,16 @@ Copyright 2023 Sebastian Kotstein
 
 
 from .input_tokenizer import InputTokenizer
-from .qa_model import QAModel
 from .output_interpreter import OutputInterpreter
+from .batch_scheduler import BatchScheduler
+from .schema_cache import SchemaCache
+from .metrics import Metrics, Gauge
+from .post_processing import rank_result
+from .lexical_filter import LexicalFilter
 
+import threading
 import uuid
 
-import numpy as np
-
 class InvalidRequestException(Exception):
     def __init__(self, message="Invalid request") -> None:
         self.message = message
@@ -30,26 +33,214 @@ class InvalidRequestException(Exception):
 
 class Pipeline:
     
-    def __init__(self, model_checkpoint, best_size = 20, cache = None, token = None) -> None:
-        self.tokenizer = InputTokenizer("microsoft/codebert-base")
-        self.model = QAModel(model_checkpoint, token=token)
-        self.interpreter = OutputInterpreter(best_size)
+    def __init__(self, model_checkpoint, best_size = 20, cache = None, token = None, padding = "max_length", padding_buckets = None, batch_size = None, max_batch_wait = None, schema_cache_size = 100, backend = "tf", onnx_path = None, quantize = None, compile = True, xla = False, intra_op_threads = None, share_weights = False, tokenizer_checkpoint = "microsoft/codebert-base", tokenizer = None, metrics = None, cache_namespace = None, prefilter_top_k = None, prefilter_min_properties = 0) -> None:
+        # latency and throughput metrics of this process (see Metrics.render), which may be shared by the pipelines of multiple models (see ModelRegistry)
+        # gauges of shared resources (e.g. the cache) are only added by the owner of the metrics
+        owns_metrics = metrics is None
+        self.metrics = Metrics() if owns_metrics else metrics
+        if tokenizer is None:
+            # cache for artifacts derived from a schema only (e.g. its tokens), which are reused across queries and requests
+            self.schema_cache = SchemaCache(schema_cache_size) if schema_cache_size else None
+            self.tokenizer = InputTokenizer(tokenizer_checkpoint, padding = padding, padding_buckets = padding_buckets, schema_cache = self.schema_cache)
+        else:
+            # the tokenizer (and its schema cache) is shared with the pipelines of other models using the same tokenizer
+            self.schema_cache = tokenizer.schema_cache
+            self.tokenizer = tokenizer
+        # the model classes are imported lazily so that TensorFlow is only required for the 'tf' backend and ONNX Runtime only for the 'onnx' backend
+        if quantize and backend != "onnx":
+            raise ValueError("Quantization '"+str(quantize)+"' requires the 'onnx' backend.")
+        if backend == "tf":
+            from .qa_model import QAModel
+            if share_weights:
+                raise ValueError("Sharing the weights across forked worker processes requires the 'onnx' backend, since TensorFlow is not fork-safe.")
+            self.model = QAModel(model_checkpoint, batch_size=batch_size, token=token, compile=compile, xla=xla, intra_op_threads=intra_op_threads)
+        elif backend == "onnx":
+            from .onnx_qa_model import ONNXQAModel
+            self.model = ONNXQAModel(model_checkpoint, onnx_path, batch_size=batch_size, token=token, intra_op_threads=intra_op_threads, quantize=quantize, share_weights=share_weights, tokenizer_checkpoint=tokenizer_checkpoint)
+        else:
+            raise ValueError("Invalid backend '"+str(backend)+"'. Allowed values are 'tf' and 'onnx'.")
+        if max_batch_wait:
+            # gather the tokenized samples of concurrent requests into shared model batches
+            self.model = BatchScheduler(self.model, batch_size or 32, max_batch_wait, self.tokenizer.tokenizer.pad_token_id, self.metrics)
+            if owns_metrics:
+                self.metrics.add(Gauge(self.metrics.prefix+"_scheduler_queue_depth", "Number of requests waiting for a shared model batch", self.model.queue_depth))
+        self.interpreter = OutputInterpreter(best_size, self.schema_cache)
+        # optional retrieval stage: only the 'prefilter_top_k' properties of long schemas that are lexically most similar to the query are fed into the model
+        self.lexical_filter = LexicalFilter(prefilter_top_k, prefilter_min_properties, self.schema_cache) if prefilter_top_k else None
         self.cache = cache
+        # if the cache is shared by multiple models, the results are cached per model (None: cache of a single model)
+        if self.lexical_filter:
+            # results of shortened schemas differ from the results of the full schemas, i.e., they are cached per pre-filter setting as well
+            prefilter = "prefilter(top_k="+str(prefilter_top_k)+",min_properties="+str(prefilter_min_properties)+")"
+            cache_namespace = cache_namespace+"/"+prefilter if cache_namespace else prefilter
+        self.cache_namespace = cache_namespace
+        if cache and owns_metrics:
+            self.metrics.add(Gauge(self.metrics.prefix+"_cache_hit_ratio", "Ratio of cache lookups that returned a cached result", lambda: self.cache.statistics()["hitRatio"]))
+            self.metrics.add(Gauge(self.metrics.prefix+"_cache_size", "Number of cached results", lambda: self.cache.statistics()["size"]))
+        self.batch_size = batch_size
+        # set as soon as the pipeline is ready to serve requests (see warm_up)
+        self.ready = threading.Event()
+
+    def post_fork(self, intra_op_threads = None):
+        """
+        Prepares the pipeline for serving requests in a worker process that has been forked after the pipeline has been created (e.g. by a uwsgi master process).
+        The model creates its inference session with the passed number of intra-op threads (if it has been created with 'share_weights'). Background threads
+        (e.g. the warm-up) must be started after calling this method, since threads do not survive a fork.
+        """
+        self.model.post_fork(intra_op_threads)
+
+    def memory_size(self):
+        """
+        Returns the (estimated) number of bytes occupied by the weights of the model
+        """
+        return self.model.memory_size()
+
+    def close(self):
+        """
+        Stops the background threads of the pipeline (if any) when the pipeline is no longer used, e.g., when its model is evicted (see ModelRegistry).
+        Requests that are still processed by the pipeline are completed.
+        """
+        self.model.close()
+
+    def warm_up(self):
+        """
+        Feeds synthetic input into the model for every padded length the tokenizer can produce so that the model's inference functions are compiled
+        (and its memory is allocated) before the first request arrives. Afterwards, the pipeline is marked as ready.
+        """
+        if self.tokenizer.padding == "max_length":
+            lengths = [self.tokenizer.max_length]
+        else:
+            lengths = self.tokenizer.padding_buckets
+        n_samples = self.batch_size or 1
+        cls_token_id = self.tokenizer.tokenizer.cls_token_id
+        pad_token_id = self.tokenizer.tokenizer.pad_token_id
+        for length in lengths:
+            self.model.predict({
+                "input_ids": [[cls_token_id] + [pad_token_id]*(length-1)]*n_samples,
+                "attention_mask": [[1] + [0]*(length-1)]*n_samples
+            })
+        self.ready.set()
     
-    def process(self, input_dict, top = None, suppress_duplicates = False, no_answer_strategy = None):
-        input_dict = self.sort_schema_values(input_dict)
-        batch = self.json_to_batch(input_dict,no_answer_strategy)
+    def process(self, input_dict, top = None, suppress_duplicates = False, no_answer_strategy = None, timings = None):
+        """
+        Processes the passed request and returns the request enriched with the results of its queries.
+        If a dictionary is passed as 'timings', it is filled with the duration (in seconds) of each stage ('cache', 'tokenize', 'predict', 'interpret', and 'merge')
+        as well as the number of windows fed into the model ('windows'), the number of queries ('queries'), and the number of queries loaded from cache ('cachedQueries').
+        """
+        if timings is None:
+            timings = dict()
+        with self.metrics.stage("cache", timings):
+            input_dict = self.sort_schema_values(input_dict)
+            # cached results are loaded once while creating the batch, since other threads may evict them before the results are merged
+            cached_results = dict()
+            batch = self.json_to_batch(input_dict,no_answer_strategy,cached_results)
+        self.count_queries(batch, cached_results, timings)
         if len(batch["qa_sample_id"]):
-            tokenized_samples = self.tokenizer.tokenize(batch)
-            output, batch_size = self.model.predict(tokenized_samples)
-            results = self.interpreter.interpret_output(tokenized_samples,output,batch_size,no_answer_strategy)
+            results = self.run_model(batch,no_answer_strategy,timings)
         else:
             results = self.interpreter.create_empty_results_dict()
-        merged_output, to_be_cached = self.merge_results_w_input_json(input_dict,results,no_answer_strategy)
-        self.store_items_in_cache(to_be_cached,no_answer_strategy)
-        merged_output = self.limit_results(merged_output,top,suppress_duplicates)
-        return self.calculate_probabilites(merged_output)
+        with self.metrics.stage("merge", timings):
+            merged_output, to_be_cached = self.merge_results_w_input_json(input_dict,results,no_answer_strategy,cached_results)
+            self.store_items_in_cache(to_be_cached,no_answer_strategy)
+            merged_output = self.rank_results(merged_output,top,suppress_duplicates)
+        self.metrics.observe_request(timings)
+        return merged_output
+
+    def count_queries(self, batch, cached_results, timings):
+        timings["queries"] = len(batch["qa_sample_id"]) + len(cached_results)
+        timings["cachedQueries"] = len(cached_results)
+        timings["windows"] = 0
+
+    def run_model(self, batch, no_answer_strategy, timings = None):
+        """
+        Tokenizes the passed batch of queries, feeds the tokenized samples into the model, and interprets the model's output.
+        If the lexical pre-filter is enabled, long schemas are shortened per query before the tokenization and the answers are mapped back to the original schemas.
+        """
+        filtered_batch, selections = batch, None
+        if self.lexical_filter:
+            with self.metrics.stage("prefilter", timings):
+                filtered_batch, selections = self.lexical_filter.filter_batch(batch)
+        with self.metrics.stage("tokenize", timings):
+            tokenized_samples = self.tokenizer.tokenize(filtered_batch)
+        self.metrics.observe_tokenized_samples(tokenized_samples, timings)
+        with self.metrics.stage("predict", timings):
+            output, batch_size = self.model.predict(tokenized_samples)
+        if not isinstance(self.model, BatchScheduler):
+            # the model processes the tokenized samples in micro-batches of 'batch_size' samples (the scheduler records the batches it creates itself)
+            micro_batch_size = self.batch_size or batch_size
+            for offset in range(0, batch_size, micro_batch_size):
+                self.metrics.batch_size.observe(min(micro_batch_size, batch_size-offset))
+        with self.metrics.stage("interpret", timings):
+            results = self.interpreter.interpret_output(tokenized_samples,output,batch_size,no_answer_strategy)
+            if selections is not None:
+                results = self.lexical_filter.restore_results(batch,selections,results)
+            return results
     
+    def process_stream(self, input_dict, top = None, suppress_duplicates = False, no_answer_strategy = None, chunk_size = 16, timings = None):
+        """
+        Processes the passed request like 'process(...)', but returns a generator that yields the result of each (schema, query) pair as soon as it is computed.
+        Results loaded from cache are yielded first, the remaining queries are processed in chunks of 'chunk_size' queries.
+        The request is validated before the generator is returned, i.e., an InvalidRequestException is raised by this method and not by the generator.
+        Each yielded item is a dictionary with the fields 'schemaId', 'queryId', 'name', 'value', 'verboseOutput', and 'result'.
+        If a dictionary is passed as 'timings', it is filled like by 'process(...)' while the generator is consumed.
+        """
+        if timings is None:
+            timings = dict()
+        with self.metrics.stage("cache", timings):
+            input_dict = self.sort_schema_values(input_dict)
+            cached_results = dict()
+            batch = self.json_to_batch(input_dict,no_answer_strategy,cached_results)
+        self.count_queries(batch, cached_results, timings)
+
+        # position (schema index, query index) of each query that is not cached
+        positions = dict()
+        for i,schema in enumerate(input_dict["schemas"]):
+            for j,query in enumerate(schema["queries"]):
+                if (i,j) not in cached_results:
+                    positions[(schema["schemaId"], query["queryId"])] = (i,j)
+
+        def create_item(i, j, result):
+            schema = input_dict["schemas"][i]
+            query = schema["queries"][j]
+            result = rank_result(result,top,suppress_duplicates)
+            return {
+                "schemaId": schema["schemaId"],
+                "queryId": query["queryId"],
+                "name": query["name"],
+                "value": query["value"],
+                "verboseOutput": query["verboseOutput"],
+                "result": result
+            }
+
+        def generate():
+            for (i,j), result in cached_results.items():
+                with self.metrics.stage("merge", timings):
+                    result["isCached"] = True
+                    item = create_item(i, j, result)
+                yield item
+
+            for offset in range(0, len(batch["qa_sample_id"]), chunk_size):
+                chunk = {key: values[offset:offset+chunk_size] for key, values in batch.items()}
+                results = self.run_model(chunk,no_answer_strategy,timings)
+                for k in range(len(results["qa_sample_id"])):
+                    with self.metrics.stage("merge", timings):
+                        i,j = positions[(results["qa_sample_paragraph_id"][k], results["qa_sample_id"][k])]
+                        result = {
+                            "answers": results["answers"][k],
+                            "tokenizedSamples": results["tokenized_samples"][k],
+                            "isCached": False
+                        }
+                        # all cached results have already been loaded, i.e., new results can be stored immediately
+                        if self.cache:
+                            schema = input_dict["schemas"][i]
+                            query = schema["queries"][j]
+                            self.cache.store(schema["value"],query["value"],no_answer_strategy,result,query["verboseOutput"],self.cache_namespace)
+                        item = create_item(i, j, result)
+                    yield item
+            self.metrics.observe_request(timings)
+
+        return generate()
+
     def sort_schema_values(self, input_dict):
         if "schemas" in input_dict:
             for i,schema in enumerate(input_dict["schemas"]):
@@ -60,63 +251,19 @@ class Pipeline:
         return input_dict
 
 
-    def limit_results(self, input_dict, top = None, suppress_duplicates = False):
+    def rank_results(self, input_dict, top = None, suppress_duplicates = False):
+        """
+        Post-processes the result of each query (see post_processing.rank_result), i.e., ranks its answers, limits them to 'top' answers,
+        optionally suppresses duplicates, and calculates their probabilities. The results are replaced by post-processed copies, since they may be shared with the cache.
+        """
         for schema in input_dict["schemas"]:
             for query in schema["queries"]:
                 if query["result"]:
-                    if suppress_duplicates:
-                        query["result"]["answers"] = self.suppress_duplicates(query["result"]["answers"])
-                        for tokenized_sample in query["result"]["tokenizedSamples"]:
-                            tokenized_sample["answers"] = self.suppress_duplicates(tokenized_sample["answers"])
-                    if top and len(query["result"]["answers"])>top:
-                        query["result"]["answers"] = query["result"]["answers"][0:top]
-                        for tokenized_sample in query["result"]["tokenizedSamples"]:
-                            if len(tokenized_sample["answers"])>top:
-                                tokenized_sample["answers"] = tokenized_sample["answers"][0:top]
-        return input_dict
-    
-    def suppress_duplicates(self, answers):
-        without_duplicates = {}
-        for answer in answers:
-            if answer["property"] is not None:
-                if answer["property"]["name"] not in without_duplicates:
-                    without_duplicates[answer["property"]["name"]] = answer
-            else:
-                if "<no-answer>" not in without_duplicates:
-                    without_duplicates["<no-answer>"] = answer
-        return [x for x in without_duplicates.values()]
-    
-    def calculate_probabilites(self, input_dict):
-        for schema in input_dict["schemas"]:
-            for query in schema["queries"]:
-                if query["result"]:
-                    result = query["result"]
-                    
-                    # calculate softmax for aggregated answer set
-                    scores = np.array([float(answer["score"]) for answer in result["answers"]])
-                    #print(scores)
-                    softmax = np.exp(scores)/sum(np.exp(scores))
-                    for i in range(len(result["answers"])):
-                        # convert score (float) into string
-                        #result["answers"][i]["score"] = str(result["answers"][i]["score"])
-                        # add probability
-                        result["answers"][i]["probability"] = str(softmax[i])
-                    
-                    for tokenized_sample in result["tokenizedSamples"]:
-                        # calculate softmax for each tokenized sample
-                        scores = np.array([float(answer["score"]) for answer in tokenized_sample["answers"]])
-                        #print(scores)
-                        softmax = np.exp(scores)/sum(np.exp(scores))
-                        sum_softmax = 0.0
-                        for i in range(len(tokenized_sample["answers"])):
-                            # convert score (float) into string
-                            #tokenized_sample["answers"][i]["score"] = str(tokenized_sample["answers"][i]["score"])
-                            # add probability
-                            tokenized_sample["answers"][i]["probability"] = str(softmax[i])
+                    query["result"] = rank_result(query["result"],top,suppress_duplicates)
         return input_dict
                     
     
-    def json_to_batch(self, input_dict, no_answer_strategy: str):
+    def json_to_batch(self, input_dict, no_answer_strategy: str, cached_results = None):
         
         batch = {
             "qa_sample_id":[],
@@ -159,7 +306,13 @@ class Pipeline:
                 if "verboseOutput" not in query:
                     query["verboseOutput"] = False
 
-                if not self.cache or (self.cache and not self.cache.has(schema["value"],query["value"],no_answer_strategy,query["verboseOutput"])):
+                cached_result = None
+                if self.cache:
+                    cached_result = self.cache.get(schema["value"],query["value"],no_answer_strategy,query["verboseOutput"],self.cache_namespace)
+                if cached_result is not None and cached_results is not None:
+                    # remember cached result by the position of the query in the request
+                    cached_results[(i,j)] = cached_result
+                else:
                     batch["qa_sample_id"].append(query["queryId"])
                     batch["qa_sample_title"].append(query["name"])
                     batch["qa_sample_query"].append(query["value"])
@@ -181,33 +334,34 @@ class Pipeline:
             }
         '''
     
-    def merge_results_w_input_json(self, input_dict, results, no_answer_strategy:str):
+    def merge_results_w_input_json(self, input_dict, results, no_answer_strategy:str, cached_results = None):
         to_be_cached = []
-        for schema in input_dict["schemas"]:
-            for query in schema["queries"]:
-                if self.cache and self.cache.has(schema["value"],query["value"],no_answer_strategy,query["verboseOutput"]):
-                    query["result"] = self.cache.load(schema["value"],query["value"],no_answer_strategy)
+        # index of the result per (schema ID, query ID)
+        result_indices = {(schema_id, query_id): k for k, (schema_id, query_id) in enumerate(zip(results["qa_sample_paragraph_id"], results["qa_sample_id"]))}
+        for i,schema in enumerate(input_dict["schemas"]):
+            for j,query in enumerate(schema["queries"]):
+                if cached_results and (i,j) in cached_results:
+                    query["result"] = cached_results[(i,j)]
                     query["result"]["isCached"]= True
-                else:
-                    for i in range(len(results["qa_sample_id"])):
-                        if results["qa_sample_paragraph_id"][i] == schema["schemaId"] and results["qa_sample_id"][i] == query["queryId"]:
-                            result = {
-                                "answers": results["answers"][i],
-                                "tokenizedSamples": results["tokenized_samples"][i]
-                            }
-                            query["result"] = result
-                            query["result"]["isCached"]= False
-
-                            if self.cache:
-                                #BUG-FIX: We MUST NOT store new items in cache until all schemas/queries have been processed.
-                                #If we store a new item in cache, an old item might be evicted although it is assumed to be in cache
-                                #self.cache.store(schema["value"],query["value"],result,query["verboseOutput"])
-                                to_be_cached.append({
-                                    "schema": schema["value"],
-                                    "query": query["value"],
-                                    "result":result,
-                                    "verbose":query["verboseOutput"]
-                                })
+                elif (schema["schemaId"], query["queryId"]) in result_indices:
+                    k = result_indices[(schema["schemaId"], query["queryId"])]
+                    result = {
+                        "answers": results["answers"][k],
+                        "tokenizedSamples": results["tokenized_samples"][k]
+                    }
+                    query["result"] = result
+                    query["result"]["isCached"]= False
+
+                    if self.cache:
+                        #BUG-FIX: We MUST NOT store new items in cache until all schemas/queries have been processed.
+                        #If we store a new item in cache, an old item might be evicted although it is assumed to be in cache
+                        #self.cache.store(schema["value"],query["value"],result,query["verboseOutput"])
+                        to_be_cached.append({
+                            "schema": schema["value"],
+                            "query": query["value"],
+                            "result":result,
+                            "verbose":query["verboseOutput"]
+                        })
                 if "result" not in query:
                     print("Warning!")
         return input_dict, to_be_cached
@@ -215,7 +369,7 @@ class Pipeline:
     def store_items_in_cache(self, to_be_cached: dict, no_answer_strategy:str):
         if self.cache:
             for item in to_be_cached:
-                self.cache.store(item["schema"],item["query"],no_answer_strategy,item["result"],item["verbose"])
+                self.cache.store(item["schema"],item["query"],no_answer_strategy,item["result"],item["verbose"],self.cache_namespace)
     
     def results_to_json(self, results_dict):
         results = {"results":[]}
@@ -0,0 +1,95 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+import numpy as np
+
+# key of the NULL answer when duplicates are suppressed (at most one NULL answer is kept)
+NO_ANSWER = "<no-answer>"
+
+def softmax(scores):
+    """
+    Numerically stable softmax (log-sum-exp trick) of the passed vector of scores
+    """
+    if not len(scores):
+        return scores
+    exp = np.exp(scores - scores.max())
+    return exp / exp.sum()
+
+def select_answers(answers, suppress_duplicates = False):
+    """
+    Ranks the passed answers by score in descending order (answers with equal scores keep their order) and optionally removes duplicates,
+    i.e., only the answer with the highest score is kept per property (and only one NULL answer).
+
+    Returns
+    -------
+    Tuple of the indices of the selected answers in the order of their rank and their scores (vector of floats)
+    """
+    # results that have been cached by previous versions (SQLite cache) contain scores as strings
+    scores = np.fromiter((float(answer["score"]) for answer in answers), dtype=np.float64, count=len(answers))
+    order = np.argsort(-scores, kind="stable")
+    if suppress_duplicates and len(order):
+        names = np.array([NO_ANSWER if answers[k]["property"] is None else answers[k]["property"]["name"] for k in order])
+        # index of the first (i.e., highest ranked) occurrence of each property, restored to the order of the ranking
+        _, first_occurrences = np.unique(names, return_index=True)
+        order = order[np.sort(first_occurrences)]
+    return order, scores[order]
+
+def create_answers(answers, order, scores, top = None):
+    """
+    Creates the ranked list of answers from the selected answers (see 'select_answers'), limits it to 'top' answers and adds the probability (softmax over the remaining scores) to each answer.
+    The passed answers are not modified, since they may be shared with the cache.
+    """
+    if top:
+        order = order[:top]
+        scores = scores[:top]
+    probabilities = softmax(scores)
+    return [dict(answers[k], score=float(score), probability=float(probability)) for k, score, probability in zip(order, scores, probabilities)]
+
+def rank_answers(answers, top = None, suppress_duplicates = False):
+    """
+    Returns the ranked list of the passed answers with at most 'top' answers, without duplicates (if 'suppress_duplicates' is set), and with probabilities
+    """
+    order, scores = select_answers(answers, suppress_duplicates)
+    return create_answers(answers, order, scores, top)
+
+def rank_result(result, top = None, suppress_duplicates = False):
+    """
+    Post-processes the passed result of a query (see Pipeline.process), i.e., ranks the aggregated answers as well as the answers of each tokenized sample (see 'rank_answers').
+    The passed result is not modified, since it may be shared with the cache.
+
+    Parameters
+    ----------
+    result : dict
+        Result of a query with the fields 'answers' and 'tokenizedSamples'
+    top : int
+        Maximum number of answers (None: unlimited). The answers of the tokenized samples are only limited if the number of aggregated answers exceeds 'top'.
+    suppress_duplicates : bool
+        If set, only the answer with the highest score is kept per property
+
+    Returns
+    -------
+    The post-processed copy of the result
+    """
+    order, scores = select_answers(result["answers"], suppress_duplicates)
+    tokenized_sample_top = top if top and len(order) > top else None
+    ranked_result = result.copy()
+    ranked_result["answers"] = create_answers(result["answers"], order, scores, top)
+    ranked_result["tokenizedSamples"] = []
+    for tokenized_sample in result["tokenizedSamples"]:
+        tokenized_sample = tokenized_sample.copy()
+        tokenized_sample["answers"] = rank_answers(tokenized_sample["answers"], tokenized_sample_top, suppress_duplicates)
+        ranked_result["tokenizedSamples"].append(tokenized_sample)
+    return ranked_result
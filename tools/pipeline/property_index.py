@@ -0,0 +1,117 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from bisect import bisect_left, bisect_right
+import re
+
+import numpy as np
+
+class PropertyIndex:
+    """
+    Index of the boundaries of all properties of a context (i.e., all sequences of characters that are separated by spaces).
+    The index is built once per context and finds the properties covered by a span by binary search.
+    """
+
+    def __init__(self, context: str) -> None:
+        self.context = context
+        # start index (inclusive) and end index (exclusive) of each property on character level, both in ascending order
+        self.starts = []
+        self.ends = []
+        for match in re.finditer(r"[^ ]+", context):
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+        # the same boundaries as vectors for determining the best properties of many spans at once
+        self.start_vector = np.asarray(self.starts, dtype=np.int64)
+        self.end_vector = np.asarray(self.ends, dtype=np.int64)
+
+    def identify_properties(self, start_char_index, end_char_index):
+        """
+        Identifies the properties that are (partially) covered by the span starting at 'start_char_index' and ending at 'end_char_index'.
+        The method returns the same list of properties as OutputInterpreter.identify_properties(...).
+
+        Parameters
+        ----------
+        start_char_index : int
+            Start index of the span on character level in the context
+        end_char_index : int
+            End index of the span on character level in the context
+
+        Returns
+        -------
+        List of identified properties
+        """
+        properties = []
+        if end_char_index <= start_char_index:
+            return properties
+        # properties ending after the start of the span and starting before the end of the span
+        for k in range(bisect_right(self.ends, start_char_index), bisect_left(self.starts, end_char_index)):
+            properties.append(self.create_property(k, start_char_index, end_char_index))
+        return properties
+
+    def create_property(self, k, start_char_index, end_char_index):
+        """
+        Creates the dictionary of the k-th property as covered by the span starting at 'start_char_index' and ending at 'end_char_index' (see OutputInterpreter.identify_properties(...) for its structure)
+        """
+        property_start = self.starts[k]
+        property_end = self.ends[k]
+        covered_start = max(property_start, start_char_index)
+        covered_end = min(property_end, end_char_index)
+        return {
+            "name": self.context[property_start:property_end],
+            "partial_name": self.context[covered_start:covered_end],
+            "length": covered_end - covered_start,
+            "partial": property_start < start_char_index or property_end > end_char_index,
+            "start_char_index": covered_start,
+            "end_char_index": covered_end
+        }
+
+    def determine_best_properties(self, start_char_indices, end_char_indices):
+        """
+        Determines the best property of each of the passed spans at once, without creating the dictionaries of the covered properties.
+        The method selects the same property as OutputInterpreter.determine_best_property(...) applied to the properties identified by 'identify_properties(...)':
+        the only fully covered property, or, if no property is fully covered, the partially covered property with the most covered characters.
+
+        Parameters
+        ----------
+        start_char_indices : np.ndarray
+            Start indices of the spans on character level in the context
+        end_char_indices : np.ndarray
+            End indices of the spans on character level in the context
+
+        Returns
+        -------
+        Vector with the index of the best property of each span or -1 if the span has no best property (no covered property or a conflict)
+        """
+        start_char_indices = np.asarray(start_char_indices, dtype=np.int64)
+        end_char_indices = np.asarray(end_char_indices, dtype=np.int64)
+        if not len(self.starts):
+            return np.full(len(start_char_indices), -1, dtype=np.int64)
+        # covered properties: first (inclusive) and last (exclusive) index of the properties overlapping the span
+        first = np.searchsorted(self.end_vector, start_char_indices, side="right")
+        last = np.searchsorted(self.start_vector, end_char_indices, side="left")
+        n_covered = np.where(end_char_indices > start_char_indices, last - first, 0)
+        # only the first and the last covered property can be covered partially, all properties in between are covered fully
+        first_index = np.minimum(first, len(self.starts)-1)
+        last_index = np.maximum(last-1, 0)
+        is_first_partial = (self.start_vector[first_index] < start_char_indices) | (self.end_vector[first_index] > end_char_indices)
+        is_last_partial = (self.start_vector[last_index] < start_char_indices) | (self.end_vector[last_index] > end_char_indices)
+        n_full = n_covered - is_first_partial - np.where(n_covered > 1, is_last_partial, False)
+        # no fully covered property: at most two partially covered properties, the one with more covered characters wins (equal lengths are a conflict)
+        first_length = np.minimum(self.end_vector[first_index], end_char_indices) - np.maximum(self.start_vector[first_index], start_char_indices)
+        last_length = np.minimum(self.end_vector[last_index], end_char_indices) - np.maximum(self.start_vector[last_index], start_char_indices)
+        best_partial = np.where(n_covered == 1, first, np.where(first_length > last_length, first, np.where(last_length > first_length, last-1, -1)))
+        best = np.where(n_full == 1, first + is_first_partial, np.where(n_full == 0, best_partial, -1))
+        return np.where(n_covered > 0, best, -1)
@@ -15,22 +15,74 @@ Copyright 2023 Sebastian Kotstein
 '''
 
 import tensorflow as tf
+import numpy as np
+import threading
 from transformers import TFAutoModelForQuestionAnswering
 
+from .model_output import QAModelOutput
+
 class QAModel:
-    def __init__(self, checkpoint, batch_size = None, token = None) -> None:
+    def __init__(self, checkpoint, batch_size = None, token = None, compile = True, xla = False, intra_op_threads = None) -> None:
+        if xla and not batch_size:
+            # without a fixed batch size, XLA would compile the inference functions again for every micro-batch size
+            raise ValueError("XLA requires a batch size, since every micro-batch is padded to this size.")
+        if intra_op_threads:
+            # must be set before TensorFlow initializes its runtime, i.e., before the model is loaded
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+            except RuntimeError:
+                # the runtime has already been initialized by a previously loaded model of this process (the setting applies to all models)
+                pass
         print(tf.config.list_physical_devices('GPU'))
         if token:
             self.model = TFAutoModelForQuestionAnswering.from_pretrained(checkpoint, token = token)
         else:
             self.model = TFAutoModelForQuestionAnswering.from_pretrained(checkpoint)
         self.batch_size = batch_size
-        
-    
+
+        # if 'compile' is set, the model is called through compiled inference functions (one per padded length) instead of Keras 'model.predict'
+        self.compile = compile
+        # if 'xla' is set, the inference functions are compiled with XLA (requires fixed shapes, i.e., every micro-batch is padded to 'batch_size' samples)
+        self.xla = xla
+        self.predict_function = tf.function(self.call_model, jit_compile=xla)
+        self.concrete_functions = dict()
+        self.lock = threading.Lock()
+
+    def post_fork(self, intra_op_threads = None):
+        # TensorFlow is not fork-safe, i.e., each worker process must load its own model (uwsgi 'lazy-apps'), which is done by the constructor
+        pass
+
+    def memory_size(self):
+        return sum([int(np.prod(weight.shape))*weight.dtype.size for weight in self.model.weights])
+
+    def close(self):
+        # the model is released as soon as it is no longer referenced (TensorFlow keeps the memory allocated for later use in this process)
+        pass
+
+    def call_model(self, input_ids, attention_mask):
+        output = self.model(input_ids=input_ids, attention_mask=attention_mask, training=False)
+        return {
+            "start_logits": output.start_logits,
+            "end_logits": output.end_logits
+        }
+
+    def get_predict_function(self, length: int):
+        """
+        Returns the compiled inference function for input sequences with the passed (padded) length. The function is traced on first use.
+        """
+        with self.lock:
+            if length not in self.concrete_functions:
+                batch_size = self.batch_size if self.xla else None
+                self.concrete_functions[length] = self.predict_function.get_concrete_function(
+                    tf.TensorSpec([batch_size, length], tf.int32, name="input_ids"),
+                    tf.TensorSpec([batch_size, length], tf.int32, name="attention_mask")
+                )
+            return self.concrete_functions[length]
             
     def predict(self, batched_samples):
         """
         Converts the passed batch of tokenized samples into a tensor that is feed into the passed transformer model for prediction.
+        If a batch size has been specified, the model processes the tokenized samples in micro-batches of this size.
         The method returns the model's output as well as the number of input samples.
         
         Parameters
@@ -43,26 +95,31 @@ class QAModel:
         The output of the model (first return parameter) and the number of input samples (second return parameter)
         """
         
-        batch_counter = 0
-        for i in range(len(batched_samples["input_ids"])):
-            # create input tensor for each sample of batch:
-            # attention mask is a binary tensor so that the model knows to which token it has to attend to (typically 0 for padded indices)
-            attention_mask_t = tf.constant([batched_samples["attention_mask"][i]])
-            input_ids_t = tf.constant([batched_samples["input_ids"][i]])
-            
-            if batch_counter == 0:
-                batch = dict()
-                batch["attention_mask"] = attention_mask_t
-                batch["input_ids"] = input_ids_t
-            else:
-                batch["attention_mask"] = tf.concat([batch["attention_mask"], attention_mask_t],axis=0)
-                batch["input_ids"] = tf.concat([batch["input_ids"],input_ids_t],axis=0)
-            batch_counter+=1
+        # create input tensors for the whole batch in one step (all tokenized samples of a batch are padded to the same length):
+        # attention mask is a binary tensor so that the model knows to which token it has to attend to (typically 0 for padded indices)
+        batch = dict()
+        batch["attention_mask"] = np.asarray(batched_samples["attention_mask"], dtype=np.int32)
+        batch["input_ids"] = np.asarray(batched_samples["input_ids"], dtype=np.int32)
+        batch_counter = batch["input_ids"].shape[0]
         
-        output = self.model.predict(batch, batch_size = self.batch_size, verbose=0)
-        return output, batch_counter
-
+        if not self.compile:
+            output = self.model.predict(batch, batch_size = self.batch_size, verbose=0)
+            return output, batch_counter
 
-    
+        batch_size = self.batch_size or batch_counter
+        predict_function = self.get_predict_function(batch["input_ids"].shape[1])
+        start_logits = []
+        end_logits = []
+        for offset in range(0, batch_counter, batch_size):
+            input_ids = batch["input_ids"][offset:offset+batch_size]
+            attention_mask = batch["attention_mask"][offset:offset+batch_size]
+            n_samples = input_ids.shape[0]
+            if self.xla and n_samples < batch_size:
+                # pad micro-batch with empty samples to the fixed batch size
+                input_ids = np.pad(input_ids, ((0, batch_size - n_samples), (0, 0)))
+                attention_mask = np.pad(attention_mask, ((0, batch_size - n_samples), (0, 0)))
+            output = predict_function(input_ids=tf.constant(input_ids), attention_mask=tf.constant(attention_mask))
+            start_logits.append(output["start_logits"].numpy()[:n_samples])
+            end_logits.append(output["end_logits"].numpy()[:n_samples])
 
-    
\ No newline at end of file
+        return QAModelOutput(np.concatenate(start_logits), np.concatenate(end_logits)), batch_counter
@@ -0,0 +1,96 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+import json
+
+import numpy as np
+
+# orjson is optional: if it is not installed, payloads are serialized with the json module of the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def format_score(score):
+    """
+    Formats the passed score like the v1 representation, i.e., as string of the (float32) sum of the start and end logit, e.g., '6.22491'
+    """
+    return str(np.float32(score))
+
+def format_probability(probability):
+    """
+    Formats the passed probability like the v1 representation, e.g., '0.3622613533592506'
+    """
+    return str(np.float64(probability))
+
+def format_answers_v1(answers):
+    formatted_answers = []
+    for answer in answers:
+        # the answers may be shared with the cache, i.e., they are copied instead of being modified
+        answer = answer.copy()
+        answer["score"] = format_score(answer["score"])
+        if "probability" in answer:
+            answer["probability"] = format_probability(answer["probability"])
+        formatted_answers.append(answer)
+    return formatted_answers
+
+def format_result_v1(result):
+    """
+    Returns a copy of the passed result of a query (see Pipeline.process) with scores and probabilities formatted as strings (v1 representation)
+    """
+    result = result.copy()
+    result["answers"] = format_answers_v1(result["answers"])
+    tokenized_samples = []
+    for tokenized_sample in result["tokenizedSamples"]:
+        tokenized_sample = tokenized_sample.copy()
+        tokenized_sample["answers"] = format_answers_v1(tokenized_sample["answers"])
+        tokenized_samples.append(tokenized_sample)
+    result["tokenizedSamples"] = tokenized_samples
+    return result
+
+def format_results_v1(input_dict):
+    """
+    Returns a copy of the passed request enriched with results (see Pipeline.process), in which the results are in the v1 representation, i.e., scores and probabilities are formatted as strings
+    """
+    output = input_dict.copy()
+    output["schemas"] = []
+    for schema in input_dict["schemas"]:
+        schema = schema.copy()
+        queries = []
+        for query in schema["queries"]:
+            query = query.copy()
+            if query.get("result"):
+                query["result"] = format_result_v1(query["result"])
+            queries.append(query)
+        schema["queries"] = queries
+        output["schemas"].append(schema)
+    return output
+
+def format_item_v1(item):
+    """
+    Returns a copy of the passed item (see Pipeline.process_stream) with its result in the v1 representation
+    """
+    item = item.copy()
+    item["result"] = format_result_v1(item["result"])
+    return item
+
+def serialize(payload):
+    """
+    Serializes the passed payload as compact JSON (bytes), using orjson if it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,69 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+import threading
+from collections import OrderedDict
+
+class SchemaCache:
+    """
+    Bounded LRU cache for artifacts that are derived from a schema (paragraph) only, e.g., its tokens, and can therefore be reused across queries and requests.
+    Each schema is mapped to a dictionary of named artifacts, which are computed on first use.
+    """
+
+    def __init__(self, max_size = 100) -> None:
+        self.max_size = max_size
+        # artifacts per schema in order of their last access (least recently used schema first)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, schema: str, name, factory):
+        """
+        Returns the artifact with the passed name of the passed schema. If the artifact does not exist yet, the method computes it by calling 'factory()' and stores it.
+
+        Parameters
+        ----------
+        schema : str
+            Schema (paragraph) the artifact belongs to
+        name :
+            Name of the artifact (any hashable value), e.g. "tokens"
+        factory :
+            Function without parameters that computes the artifact
+
+        Returns
+        -------
+        The (cached) artifact
+        """
+        with self.lock:
+            if schema in self.entries:
+                self.entries.move_to_end(schema)
+                entry = self.entries[schema]
+                if name in entry:
+                    return entry[name]
+            else:
+                entry = dict()
+                self.entries[schema] = entry
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+
+        # compute artifact without holding the lock (at worst, concurrent threads compute the same artifact twice)
+        artifact = factory()
+        with self.lock:
+            entry[name] = artifact
+        return artifact
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,208 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+from .lru_cache import LRUCache
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+class SQLiteCache:
+    """
+    Persistent LRU cache for prediction results that is stored in an SQLite database on disk.
+    The cache provides the same methods as the LRUCache, but, since the database file can be opened by multiple processes,
+    all workers of a node share the cached results and the results survive restarts.
+    Lookups only read the database: the position of a hit item is updated only if it has not been updated for 'priority_update_interval' seconds (i.e., the eviction order is an approximate LRU order)
+    and the hit/miss statistics are counted per process, so that lookups do not compete for the write lock of the database.
+    """
+
+    def __init__(self, path: str, max_size = 1000, debug = False, priority_update_interval = 10.0) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.debug = debug
+        self.priority_update_interval_ns = int(priority_update_interval*1e9)
+
+        # hit/miss statistics of this process
+        self.hits = 0
+        self.misses = 0
+        self.statistics_lock = threading.Lock()
+
+        # one connection per thread and process (SQLite connections must neither be shared between threads nor survive a fork)
+        self.connections = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self.connection()
+        # drop items of a database created by a version with full-text keys (these keys are not compatible with digest keys)
+        columns = [column[1] for column in connection.execute("PRAGMA table_info(items)").fetchall()]
+        if columns and "description" not in columns:
+            connection.execute("DROP TABLE items")
+        connection.execute("CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, id TEXT NOT NULL UNIQUE, description TEXT NOT NULL, result TEXT NOT NULL, verbose INTEGER NOT NULL, priority INTEGER NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS items_priority ON items (priority)")
+        connection.execute("CREATE TABLE IF NOT EXISTS statistics (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        connection.execute("INSERT OR IGNORE INTO statistics (name, value) VALUES ('evictions', 0)")
+
+    def connection(self):
+        if getattr(self.connections, "pid", None) != os.getpid():
+            # autocommit mode, transactions are started explicitly
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.connections.connection = connection
+            self.connections.pid = os.getpid()
+        return self.connections.connection
+
+    def has(self, schema: str, query: str, no_answer_strategy: str, verbose: bool, model: str = None):
+        key = self.generate_key(schema,query,no_answer_strategy,model)
+        row = self.connection().execute("SELECT verbose FROM items WHERE key = ?", (key,)).fetchone()
+        if row:
+            return not verbose or bool(row[0])
+        else:
+            return False
+
+    def get(self, schema: str, query: str, no_answer_strategy: str, verbose: bool, model: str = None):
+        """
+        Looks up and loads the result for the passed schema, query, and no-answer strategy in one step and updates the hit/miss statistics.
+        The method returns the cached result or 'None' if the cache does not contain a result or only a non-verbose result although a verbose result is requested.
+        """
+        key = self.generate_key(schema,query,no_answer_strategy,model)
+        connection = self.connection()
+        row = connection.execute("SELECT result, verbose, priority FROM items WHERE key = ?", (key,)).fetchone()
+        if row and (not verbose or row[1]):
+            self.touch(connection, key, row[2])
+            with self.statistics_lock:
+                self.hits += 1
+            return json.loads(row[0])
+        else:
+            with self.statistics_lock:
+                self.misses += 1
+            return None
+
+    def load(self, schema: str, query: str, no_answer_strategy:str, model: str = None):
+        key = self.generate_key(schema,query,no_answer_strategy,model)
+        connection = self.connection()
+        row = connection.execute("SELECT result, priority FROM items WHERE key = ?", (key,)).fetchone()
+        if row:
+            if self.debug:
+                print("Load "+key)
+            self.touch(connection, key, row[1])
+            return json.loads(row[0])
+        else:
+            if self.debug:
+                print("Load "+key+" - not found")
+            return None
+
+    def touch(self, connection, key: str, priority: int):
+        """
+        Marks the item with the passed key as recently used, unless its priority has been updated less than 'priority_update_interval' seconds ago
+        """
+        now = time.time_ns()
+        if now - priority >= self.priority_update_interval_ns:
+            connection.execute("UPDATE items SET priority = ? WHERE key = ?", (now, key))
+
+    def store(self, schema: str, query: str, no_answer_strategy: str, result, verbose: bool, model: str = None):
+        key = self.generate_key(schema,query,no_answer_strategy,model)
+        if self.debug:
+            print("Store "+key)
+        data = json.dumps(result)
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO items (key, id, description, result, verbose, priority) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET result = excluded.result, verbose = excluded.verbose, priority = excluded.priority",
+                (key, str(uuid.uuid4()), json.dumps(self.describe_key(schema,query,no_answer_strategy,model)), data, int(verbose), time.time_ns())
+            )
+            # evict least recently used items
+            size = connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            if size > self.max_size:
+                evicted = connection.execute("DELETE FROM items WHERE key IN (SELECT key FROM items ORDER BY priority LIMIT ?)", (size - self.max_size,)).rowcount
+                connection.execute("UPDATE statistics SET value = value + ? WHERE name = 'evictions'", (evicted,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def evict(self, key: str):
+        if self.debug:
+            print("Evict "+key)
+        connection = self.connection()
+        if connection.execute("DELETE FROM items WHERE key = ?", (key,)).rowcount:
+            connection.execute("UPDATE statistics SET value = value + 1 WHERE name = 'evictions'")
+
+    def evict_all(self):
+        if self.debug:
+            print("Evict all")
+        self.connection().execute("DELETE FROM items")
+
+    def items(self):
+        """
+        Returns a list of all cached items (without their results) in order of their last access, i.e., the least recently used item first.
+        Each item is a dictionary with the fields 'id', 'key', 'description', 'priority', and 'isVerbose'.
+        """
+        rows = self.connection().execute("SELECT id, key, description, priority, verbose FROM items ORDER BY priority").fetchall()
+        return [
+            {
+                "id": id,
+                "key": key,
+                "description": json.loads(description),
+                "priority": priority,
+                "isVerbose": bool(verbose)
+            } for id, key, description, priority, verbose in rows
+        ]
+
+    def get_item(self, id: str):
+        """
+        Returns the cached item with the passed ID including its result (field 'data') or 'None' if there is no item with this ID.
+        Reading an item does not change its position in the cache.
+        """
+        row = self.connection().execute("SELECT key, description, priority, verbose, result FROM items WHERE id = ?", (id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": id,
+            "key": row[0],
+            "description": json.loads(row[1]),
+            "priority": row[2],
+            "isVerbose": bool(row[3]),
+            "data": json.loads(row[4])
+        }
+
+    def statistics(self):
+        """
+        Returns the number of cached items, the maximum size, the hit and miss counters (of this process), and the eviction counter (of all processes sharing the cache) as dictionary.
+        """
+        connection = self.connection()
+        evictions = connection.execute("SELECT value FROM statistics WHERE name = 'evictions'").fetchone()[0]
+        with self.statistics_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "size": connection.execute("SELECT COUNT(*) FROM items").fetchone()[0],
+            "maxSize": self.max_size,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hitRatio": hits/lookups if lookups else None
+        }
+
+    # keys and their descriptions are generated the same way as for the in-memory cache
+    generate_key = LRUCache.generate_key
+    describe_key = LRUCache.describe_key
@@ -1,11 +1,19 @@
 MIME_TYPE_BASE = "application/vnd.skotstein.restberta-core"
 MIME_TYPE_APPLICATION_JSON = "application/json"
+MIME_TYPE_APPLICATION_NDJSON = "application/x-ndjson"
 MIME_TYPE_TEXT_HTML = "text/html"
 MIME_TYPE_APPLICATION_XHTML_XML = "application/xhtml+xml"
+MIME_TYPE_PROMETHEUS_TEXT = "text/plain; version=0.0.4"
 MIME_TYPE_ERROR_V1_JSON = MIME_TYPE_BASE+".error.v1+json"
 MIME_TYPE_HYPERMEDIA_V1_JSON = MIME_TYPE_BASE+".hypermedia.v1+json"
 MIME_TYPE_RESULTS_V1_JSON = MIME_TYPE_BASE+".results.v1+json"
+MIME_TYPE_RESULTS_V1_NDJSON = MIME_TYPE_BASE+".results.v1+x-ndjson"
+MIME_TYPE_RESULTS_V2_JSON = MIME_TYPE_BASE+".results.v2+json"
+MIME_TYPE_RESULTS_V2_NDJSON = MIME_TYPE_BASE+".results.v2+x-ndjson"
 MIME_TYPE_SCHEMAS_V1_JSON = MIME_TYPE_BASE+".schemas.v1+json"
 MIME_TYPE_CACHE_SETTINGS_V1_JSON = MIME_TYPE_BASE+".cache-settings.v1.json"
 MIME_TYPE_CACHED_ITEMS_V1_JSON = MIME_TYPE_BASE+".cached-items.v1.json"
-MIME_TYPE_CACHED_ITEM_V1_JSON = MIME_TYPE_BASE+".cached-item.v1.json"
\ No newline at end of file
+MIME_TYPE_CACHED_ITEM_V1_JSON = MIME_TYPE_BASE+".cached-item.v1.json"
+MIME_TYPE_JOB_V1_JSON = MIME_TYPE_BASE+".job.v1+json"
+MIME_TYPE_READINESS_V1_JSON = MIME_TYPE_BASE+".readiness.v1+json"
+MIME_TYPE_MODELS_V1_JSON = MIME_TYPE_BASE+".models.v1+json"
\ No newline at end of file
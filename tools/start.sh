@@ -1,3 +1,12 @@
 #!/usr/bin/env bash
+# the tokenizer must not use its thread pool in a process that is forked afterwards
+export TOKENIZERS_PARALLELISM=false
+export PROCESSES=${PROCESSES:-1}
 service nginx start
-uwsgi --ini uwsgi.ini
\ No newline at end of file
+if [ "${BACKEND:-tf}" = "onnx" ]; then
+    # the model is loaded once by the master process and shared copy-on-write by the forked worker processes
+    uwsgi --ini uwsgi.ini --processes ${PROCESSES}
+else
+    # TensorFlow is not fork-safe, i.e., each worker process loads its own model after forking ('lazy-apps')
+    uwsgi --ini uwsgi.ini --processes ${PROCESSES} --lazy-apps
+fi
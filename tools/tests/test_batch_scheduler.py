@@ -0,0 +1,87 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# Tests the BatchScheduler with a stub model. Run from the 'tools' directory: python -m unittest discover tests
+
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from pipeline.batch_scheduler import BatchScheduler
+from pipeline.model_output import QAModelOutput
+
+class SlowModel:
+    """
+    Stub model that returns the input IDs as logits after sleeping for 'delay' seconds
+    """
+
+    def __init__(self, delay) -> None:
+        self.delay = delay
+
+    def predict(self, batched_samples):
+        time.sleep(self.delay)
+        input_ids = np.asarray(batched_samples["input_ids"], dtype=np.float32)
+        return QAModelOutput(input_ids, -input_ids), input_ids.shape[0]
+
+    def close(self):
+        pass
+
+def create_samples(value, n = 1, length = 4):
+    return {"input_ids": np.full((n, length), value, dtype=np.int32), "attention_mask": np.ones((n, length), dtype=np.int32)}
+
+class BatchSchedulerTest(unittest.TestCase):
+
+    def predict_in_background(self, scheduler, samples):
+        results = dict()
+        thread = threading.Thread(target=lambda: results.setdefault("output", scheduler.predict(samples)), daemon=True)
+        thread.start()
+        return thread, results
+
+    def test_predict(self):
+        scheduler = BatchScheduler(SlowModel(0.0), max_batch_size=4, max_wait=0.01)
+        output, n = scheduler.predict(create_samples(3, n=2))
+        self.assertEqual(n, 2)
+        self.assertTrue(np.array_equal(output.start_logits, np.full((2, 4), 3)))
+
+    def test_predict_after_close(self):
+        # a request that still holds an evicted (closed) pipeline must not wait for the stopped worker thread
+        scheduler = BatchScheduler(SlowModel(0.3), max_batch_size=4, max_wait=0.0)
+        first, first_results = self.predict_in_background(scheduler, create_samples(1))
+        time.sleep(0.1)
+        scheduler.close()
+        second, second_results = self.predict_in_background(scheduler, create_samples(2))
+        first.join(3)
+        second.join(3)
+        self.assertFalse(first.is_alive())
+        self.assertFalse(second.is_alive())
+        self.assertTrue(np.array_equal(first_results["output"][0].start_logits, np.full((1, 4), 1)))
+        self.assertTrue(np.array_equal(second_results["output"][0].start_logits, np.full((1, 4), 2)))
+
+    def test_requests_queued_before_close(self):
+        # requests enqueued before 'close' are processed by the worker thread before it stops
+        scheduler = BatchScheduler(SlowModel(0.2), max_batch_size=1, max_wait=0.0)
+        threads = [self.predict_in_background(scheduler, create_samples(k)) for k in range(3)]
+        time.sleep(0.1)
+        scheduler.close()
+        for thread, results in threads:
+            thread.join(3)
+            self.assertFalse(thread.is_alive())
+            self.assertIn("output", results)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+'''
+Copyright 2023 Sebastian Kotstein
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+'''
+
+# Compares the vectorized answer extraction (OutputInterpreter.get_answers, PropertyIndex.determine_best_properties) with the
+# original loop implementations on fixed logits and offsets. Run from the 'tools' directory: python -m unittest discover tests
+
+import unittest
+
+import numpy as np
+
+from pipeline.output_interpreter import OutputInterpreter
+from pipeline.property_index import PropertyIndex
+
+PARAGRAPH = "users[*].id users[*].name address.city address.postal_code _links.href a averyveryveryveryveryveryverylongpropertyname.id"
+
+def identify_properties_loop(context, start_char_index, end_char_index):
+    """
+    Original implementation of OutputInterpreter.identify_properties, which walks over the characters of the span
+    """
+    properties = []
+    current_property = None
+    is_on_property = False
+    for i in range(end_char_index-start_char_index):
+        index = start_char_index+i
+        c = context[index]
+        if c == " ":
+            if is_on_property:
+                current_property["end_char_index"] = index
+                if current_property["start_char_index"] == start_char_index:
+                    back_counter = start_char_index-1
+                    while back_counter >= 0 and context[back_counter] != " ":
+                        current_property["name"] = context[back_counter] + current_property["name"]
+                        current_property["partial"] = True
+                        back_counter-=1
+                properties.append(current_property)
+                current_property = None
+            is_on_property = False
+        else:
+            if not is_on_property:
+                current_property = {"name": c, "partial_name": c, "length": 1, "partial": False, "start_char_index": index, "end_char_index": None}
+            else:
+                current_property["name"]+= c
+                current_property["partial_name"]+= c
+                current_property["length"]+=1
+            is_on_property = True
+    if current_property:
+        current_property["end_char_index"] = end_char_index
+        forward_counter = end_char_index
+        while forward_counter < len(context) and context[forward_counter] != " ":
+            current_property["name"] = current_property["name"] + context[forward_counter]
+            current_property["partial"] = True
+            forward_counter+=1
+        if len(properties) == 0:
+            back_counter = start_char_index-1
+            while back_counter >= 0 and context[back_counter] != " ":
+                current_property["name"] = context[back_counter] + current_property["name"]
+                current_property["partial"] = True
+                back_counter-=1
+        properties.append(current_property)
+    return properties
+
+def get_answers_loop(interpreter, offset_mapping, cls_index, paragraph, predicted_start_logits, predicted_end_logits, max_answer_length = None):
+    """
+    Original implementation of OutputInterpreter.get_answers, which evaluates each pair of start and end indices separately
+    (scores are returned as floats, since the vectorized implementation formats them only when the results are serialized)
+    """
+    best_start_indices = np.argsort(predicted_start_logits)[-1 : -interpreter.n_best_size - 1 : -1].tolist()
+    best_end_indices = np.argsort(predicted_end_logits)[-1 : -interpreter.n_best_size - 1 : -1].tolist()
+    valid_answers = []
+    for start_index in best_start_indices:
+        for end_index in best_end_indices:
+            if interpreter.are_indices_out_of_context(start_index,end_index,offset_mapping):
+                continue
+            if interpreter.is_end_before_start(start_index, end_index):
+                continue
+            if interpreter.is_answer_too_long(start_index, end_index, max_answer_length):
+                continue
+            start_char_index = offset_mapping[start_index][0]
+            end_char_index = offset_mapping[end_index][1]
+            best_property = interpreter.determine_best_property(identify_properties_loop(paragraph,start_char_index,end_char_index))
+            if best_property is None:
+                continue
+            valid_answers.append({
+                "score": float(predicted_start_logits[start_index] + predicted_end_logits[end_index]),
+                "span": paragraph[start_char_index:end_char_index],
+                "start_char_index": start_char_index,
+                "end_char_index": end_char_index,
+                "property": best_property
+            })
+    valid_answers.append({
+        "score": float(predicted_start_logits[cls_index] + predicted_end_logits[cls_index]),
+        "span": None,
+        "start_char_index": cls_index,
+        "end_char_index": cls_index,
+        "property": None
+    })
+    return sorted(valid_answers, key=lambda x: x["score"], reverse=True)
+
+def create_offset_mapping(paragraph, n_query_tokens = 4, token_length = 4):
+    """
+    Creates the masked offset mapping of a tokenized sample '<s> query </s></s> paragraph </s>': each property of the paragraph is split into tokens of 'token_length' characters
+    """
+    offset_mapping = [None]*(n_query_tokens + 3)
+    start = 0
+    for word in paragraph.split(" "):
+        for k in range(0, len(word), token_length):
+            offset_mapping.append((start + k, start + min(k + token_length, len(word))))
+        start += len(word) + 1
+    offset_mapping.append(None)
+    return offset_mapping
+
+def canonical(answers):
+    """
+    Orders answers with equal scores by their span, since the loop implementation breaks ties by the unspecified order of 'np.argsort'
+    """
+    return sorted(answers, key=lambda answer: (-answer["score"], answer["start_char_index"], answer["end_char_index"]))
+
+class GetAnswersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.offset_mapping = create_offset_mapping(PARAGRAPH)
+        self.n_tokens = len(self.offset_mapping)
+        self.paragraph_tokens = [k for k, offsets in enumerate(self.offset_mapping) if offsets is not None]
+
+    def assert_same_answers(self, best_size, start_logits, end_logits):
+        interpreter = OutputInterpreter(best_size)
+        expected = get_answers_loop(interpreter, self.offset_mapping, 0, PARAGRAPH, start_logits, end_logits)
+        actual = interpreter.get_answers(self.offset_mapping, 0, PARAGRAPH, start_logits, end_logits)
+        self.assertEqual(canonical(actual), canonical(expected))
+        self.assertEqual([answer["score"] for answer in actual], [answer["score"] for answer in expected])
+        return actual
+
+    def test_random_logits(self):
+        rng = np.random.default_rng(0)
+        for best_size in [1, 5, 20, self.n_tokens + 5]:
+            for _ in range(20):
+                start_logits = rng.standard_normal(self.n_tokens).astype(np.float32)
+                end_logits = rng.standard_normal(self.n_tokens).astype(np.float32)
+                self.assert_same_answers(best_size, start_logits, end_logits)
+
+    def test_ties(self):
+        # logits with few distinct values, i.e., many pairs have the same score (all tied tokens are within the best indices)
+        rng = np.random.default_rng(1)
+        for _ in range(20):
+            start_logits = rng.integers(0, 3, self.n_tokens).astype(np.float32)
+            end_logits = rng.integers(0, 3, self.n_tokens).astype(np.float32)
+            actual = self.assert_same_answers(self.n_tokens, start_logits, end_logits)
+            # answers with equal scores are ordered by their start and end token (and the NULL answer last)
+            scores = [answer["score"] for answer in actual]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_spans_crossing_property_boundaries(self):
+        # starts in the middle of properties and ends in the middle of the following ones: partial properties, conflicts between full properties, and partial length ties
+        start_logits = np.full(self.n_tokens, -10.0, dtype=np.float32)
+        end_logits = np.full(self.n_tokens, -10.0, dtype=np.float32)
+        start_logits[self.paragraph_tokens[1::3]] = np.arange(len(self.paragraph_tokens[1::3]), dtype=np.float32)
+        end_logits[self.paragraph_tokens[::2]] = np.arange(len(self.paragraph_tokens[::2]), dtype=np.float32)[::-1]
+        answers = self.assert_same_answers(self.n_tokens, start_logits, end_logits)
+        self.assertTrue(any(answer["property"] is not None and answer["property"]["partial"] for answer in answers))
+        self.assertTrue(any(" " in answer["span"] for answer in answers if answer["property"] is not None))
+
+    def test_long_answers(self):
+        # the maximum answer length is disabled in both implementations, i.e., a span over all tokens of the long property is kept
+        long_property = PARAGRAPH.split(" ")[-1]
+        start_char_index = PARAGRAPH.index(long_property)
+        tokens = [k for k in self.paragraph_tokens if self.offset_mapping[k][0] >= start_char_index]
+        # distinct logits, so that both implementations select the same best indices
+        start_logits = -np.arange(self.n_tokens, dtype=np.float32)
+        end_logits = -np.arange(self.n_tokens, dtype=np.float32)[::-1]
+        start_logits[tokens[0]] = 5.0
+        end_logits[tokens[-1]] = 5.0
+        answers = self.assert_same_answers(3, start_logits, end_logits)
+        self.assertGreater(len(tokens), 10)
+        self.assertEqual(answers[0]["span"], long_property)
+        self.assertFalse(answers[0]["property"]["partial"])
+
+class DetermineBestPropertiesTest(unittest.TestCase):
+
+    def test_all_spans(self):
+        interpreter = OutputInterpreter(20)
+        index = PropertyIndex(PARAGRAPH)
+        # spans as created from token offsets, which neither start nor end with a space (the loop implementation assigns wrong names to such spans)
+        spans = [(start, end) for start in range(len(PARAGRAPH)) for end in range(start+1, len(PARAGRAPH)+1) if PARAGRAPH[start] != " " and PARAGRAPH[end-1] != " "]
+        best_properties = index.determine_best_properties([start for start, _ in spans], [end for _, end in spans])
+        for (start, end), k in zip(spans, best_properties):
+            expected = interpreter.determine_best_property(identify_properties_loop(PARAGRAPH, start, end))
+            actual = index.create_property(int(k), start, end) if k >= 0 else None
+            self.assertEqual(actual, expected, (start, end))
+
+    def test_empty_context(self):
+        self.assertEqual(PropertyIndex("").determine_best_properties([0], [0]).tolist(), [-1])
+
+if __name__ == "__main__":
+    unittest.main()